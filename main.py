@@ -1,10 +1,11 @@
+import asyncio
 import sys
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.responses import FileResponse
 from loguru import logger
-from pydantic import HttpUrl
+from pydantic import BaseModel, Field, HttpUrl
 
 from src.apicloud import check_bankruptcy_status
 from src.browser import Browser
@@ -17,6 +18,11 @@ logger.remove()
 logger.add(sys.stderr, level="INFO")
 logger.add("logs/api_runs.log", rotation="1 day", level="INFO")
 
+RDL_BATCH_MAX_ITEMS = 64
+# Checks of one batch run one after another: they share browser_manager, and a proxy
+# switch relaunches its context under the pages of any other check in flight
+RDL_BATCH_CONCURRENCY = 1
+
 # --- MODIFIED: Create a single, global browser instance with persistent storage ---
 browser_manager = Browser(headless=True, datadir="datadir")
 
@@ -26,13 +32,13 @@ async def lifespan(app: FastAPI):
     # --- On startup ---
     logger.info("FastAPI app starting up...")
     await browser_manager.launch()
-    # Also initialize the PDF browser session if needed
-    logger.info("PDF browser will be initialized on first use.")
+    # The PDF session reuses this browser context and is created on first use
+    logger.info("PDF session will be initialized on first use.")
     yield
     # --- On shutdown ---
     logger.info("FastAPI app shutting down...")
     await browser_manager.close()
-    await close_global_pdf_session()
+    close_global_pdf_session()
     logger.info("Global browser sessions closed.")
 
 
@@ -68,6 +74,33 @@ async def get_company_card(inn: str):
         )
 
 
+async def _company_rdl(inn: str, publish_date: str) -> dict:
+    """Runs the RDL check; raises HTTPException the way /company_rdl/{inn} reports errors."""
+    if not browser_manager.is_connected():
+        raise HTTPException(status_code=503, detail="Browser service is not available.")
+
+    try:
+        result = await fetch_company_data(
+            browser_manager.context,
+            inn,
+            method="rdl",
+            publish_date=publish_date,  # new kwarg
+        )
+        if isinstance(result, dict) and result.get("error"):
+            raise HTTPException(status_code=404, detail=result["error"])
+
+        # Ensure the final payload shape
+        return {"success": True, "data": result}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Failed to process company_rdl for INN {inn}: {e}")
+        raise HTTPException(
+            status_code=500, detail=f"An internal error occurred: {str(e)}"
+        )
+
+
 @app.get("/company_rdl/{inn}")
 async def get_company_rdl(
     inn: str, publish_date: str = Query(..., regex=r"^\d{2}\.\d{2}\.\d{4}$")
@@ -93,30 +126,42 @@ async def get_company_rdl(
     logger.info(
         f"Received request for company_rdl with INN={inn}, publish_date={publish_date}"
     )
-    if not browser_manager.is_connected():
-        raise HTTPException(status_code=503, detail="Browser service is not available.")
+    return await _company_rdl(inn, publish_date)
 
-    try:
-        result = await fetch_company_data(
-            browser_manager.context,
-            inn,
-            method="rdl",
-            publish_date=publish_date,  # new kwarg
-        )
-        if isinstance(result, dict) and result.get("error"):
-            raise HTTPException(status_code=404, detail=result["error"])
 
-        # Ensure the final payload shape
-        return {"success": True, "data": result}
+class RdlBatchItem(BaseModel):
+    inn: str
+    publish_date: str = Field(..., pattern=r"^\d{2}\.\d{2}\.\d{4}$")
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception(f"Failed to process company_rdl for INN {inn}: {e}")
+
+@app.post("/company_rdl/batch")
+async def get_company_rdl_batch(items: list[RdlBatchItem]):
+    """
+    Runs /company_rdl/{inn} for several INNs in one request (used by src/rdl_batch.py).
+    At most RDL_BATCH_CONCURRENCY checks share the browser at a time.
+
+    Response format: {"success": True, "data": [item, ...]} in request order, where
+    each item is the single endpoint's body plus its status code:
+    {"status_code": 200, "success": True, "data": {...}} or
+    {"status_code": 404/500/503, "success": False, "detail": "..."}
+    """
+    logger.info(f"Received request for company_rdl batch with {len(items)} items")
+    if len(items) > RDL_BATCH_MAX_ITEMS:
         raise HTTPException(
-            status_code=500, detail=f"An internal error occurred: {str(e)}"
+            status_code=413, detail=f"At most {RDL_BATCH_MAX_ITEMS} items per batch."
         )
 
+    sem = asyncio.Semaphore(RDL_BATCH_CONCURRENCY)
+
+    async def one(item: RdlBatchItem) -> dict:
+        async with sem:
+            try:
+                return {"status_code": 200, **await _company_rdl(item.inn, item.publish_date)}
+            except HTTPException as e:
+                return {"status_code": e.status_code, "success": False, "detail": e.detail}
+
+    return {"success": True, "data": await asyncio.gather(*(one(i) for i in items))}
+
 
 @app.get("/company_finances/{inn}")
 async def get_company_finances(
@@ -219,9 +264,10 @@ async def pdf_extract(
     Extracts text from a PDF file located at a given URL using a shared browser instance.
     """
     logger.info(f"Received request to extract text from PDF at URL: {url}")
+    if not browser_manager.is_connected():
+        raise HTTPException(status_code=503, detail="Browser service is not available.")
     try:
-        # The 'await' keyword is removed here as the error suggests extract_text_from_url is not a coroutine
-        result = extract_text_from_url(str(url))
+        result = await extract_text_from_url(browser_manager, str(url))
         if not result["success"]:
             raise HTTPException(status_code=400, detail=result["error"])
         return result
@@ -1,3 +1,6 @@
+import asyncio
+import time
+
 from loguru import logger
 from patchright.async_api import (
     Browser as PlaywrightBrowser,
@@ -16,15 +19,40 @@ from src.proxy_manager import ProxyManager
 class Browser:
     """Manages a persistent Playwright browser instance and context."""
 
-    def __init__(self, headless: bool = True, datadir: str | None = None):
+    def __init__(
+        self,
+        headless: bool = True,
+        datadir: str | None = None,
+        args: list[str] | None = None,
+        viewport: dict | None = None,
+    ):
         self._headless = headless
         self._datadir = datadir
+        # Extra Chromium flags / viewport for every (re)launch; None keeps Playwright defaults
+        self._args = args
+        self._viewport = viewport
         self._playwright_context_manager = None  # type: object | None
         self._playwright: Playwright | None = None
         self._browser: PlaywrightBrowser | None = None
         self.default_context: BrowserContext | None = None
         self.proxy_manager = ProxyManager.from_file("proxies.txt")
         self._using_proxy = False  # Track if we're currently using proxy
+        self._proxy: dict | None = None  # Proxy of the current context, if any
+        # Serializes context relaunches; concurrent callers wait here instead of
+        # seeing default_context closed or None mid-switch
+        self._switch_lock = asyncio.Lock()
+
+    def _launch_options(self) -> dict:
+        options = {
+            "user_data_dir": self._datadir,
+            "headless": self._headless,
+            "channel": "chrome",
+        }
+        if self._args:
+            options["args"] = self._args
+        if self._viewport:
+            options["viewport"] = self._viewport
+        return options
 
     @property
     def context(self) -> BrowserContext | None:
@@ -48,9 +76,7 @@ class Browser:
         )
         self.default_context = (
             await self._playwright.chromium.launch_persistent_context(
-                user_data_dir=self._datadir,
-                headless=self._headless,
-                channel="chrome",
+                **self._launch_options()
             )
         )
 
@@ -64,7 +90,8 @@ class Browser:
         """
         page = None
         try:
-            page = await self.default_context.new_page()
+            context = await self._current_context()
+            page = await context.new_page()
             await page.goto(url, **kwargs)
             return page
         except (TimeoutError, Error) as e:
@@ -99,24 +126,26 @@ class Browser:
             # Try rotating through proxies until one works
             max_proxy_attempts = 5  # Limit proxy rotation attempts
             for attempt in range(max_proxy_attempts):
-                # Get new proxy
-                new_proxy = self.proxy_manager.get_next_proxy()
+                # Switch to proxy mode by recreating persistent context with a new proxy,
+                # unless a concurrent request already replaced the context that failed
+                new_proxy = await self._switch_to_proxy(context)
                 if not new_proxy:
                     logger.error("No proxies available to retry.")
                     raise
 
-                # Switch to proxy mode by recreating persistent context with proxy
-                await self._switch_to_proxy(new_proxy)
-
                 # Retry with the new proxied persistent context
                 try:
-                    page = await self.default_context.new_page()
+                    context = await self._current_context()
+                    page = await context.new_page()
+                    started = time.monotonic()
                     await page.goto(url, **kwargs)
+                    self.proxy_manager.report_result(new_proxy, time.monotonic() - started, ok=True)
                     logger.success(
                         f"Successfully loaded URL with proxy after {attempt + 1} attempt(s)"
                     )
                     return page
                 except (TimeoutError, Error) as proxy_error:
+                    self.proxy_manager.report_result(new_proxy, None, ok=False)
                     # Clean up page
                     if page:
                         await page.close()
@@ -147,38 +176,55 @@ class Browser:
                         logger.error(f"All {max_proxy_attempts} proxy attempts failed")
                         raise proxy_error
 
-    async def _switch_to_proxy(self, proxy_config: dict):
+    async def _current_context(self) -> BrowserContext:
+        """The active context; waits while another request is relaunching it."""
+        async with self._switch_lock:
+            return self.default_context
+
+    async def _switch_to_proxy(self, failed_context: BrowserContext | None) -> dict | None:
         """
-        Recreates the persistent context with proxy configuration.
+        Recreates the persistent context with the next proxy.
         Maintains the same datadir for saved passwords/cookies.
+        If failed_context was already replaced by a concurrent request, the new context
+        is kept as is: only one relaunch per failure, never two racing on one datadir.
+        Returns the proxy now in use, None if no proxies are left.
         """
-        if self._using_proxy:
-            logger.info("Already using proxy, updating to new proxy...")
-        else:
-            logger.info("Switching to proxy mode for all subsequent requests...")
+        async with self._switch_lock:
+            if self.default_context is not failed_context and self._proxy:
+                logger.info("Context already switched to a proxy by a concurrent request")
+                return self._proxy
 
-        # Close the existing persistent context
-        if self.default_context:
-            await self.default_context.close()
-            self.default_context = None
+            proxy_config = self.proxy_manager.get_next_proxy()
+            if not proxy_config:
+                return None
 
-        # Recreate persistent context with the SAME datadir but WITH proxy
-        logger.info(
-            f"Launching persistent context with proxy: {proxy_config['server']}"
-        )
-        self.default_context = (
-            await self._playwright.chromium.launch_persistent_context(
-                user_data_dir=self._datadir,
-                headless=self._headless,
-                channel="chrome",
-                proxy=proxy_config,  # Add proxy configuration
+            if self._using_proxy:
+                logger.info("Already using proxy, updating to new proxy...")
+            else:
+                logger.info("Switching to proxy mode for all subsequent requests...")
+
+            # Close the existing persistent context
+            if self.default_context:
+                await self.default_context.close()
+                self.default_context = None
+
+            # Recreate persistent context with the SAME datadir but WITH proxy
+            logger.info(
+                f"Launching persistent context with proxy: {proxy_config['server']}"
+            )
+            self.default_context = (
+                await self._playwright.chromium.launch_persistent_context(
+                    **self._launch_options(),
+                    proxy=proxy_config,  # Add proxy configuration
+                )
             )
-        )
 
-        self._using_proxy = True
-        logger.success(
-            "Persistent context recreated with proxy. All future requests will use this proxy."
-        )
+            self._using_proxy = True
+            self._proxy = proxy_config
+            logger.success(
+                "Persistent context recreated with proxy. All future requests will use this proxy."
+            )
+            return proxy_config
 
     async def close(self):
         """Close the persistent context and stop Playwright."""
@@ -200,6 +246,7 @@ class Browser:
 
         self._playwright_context_manager = None
         self._using_proxy = False
+        self._proxy = None
 
     def is_connected(self) -> bool:
         """
@@ -3,6 +3,7 @@ import datetime
 import json
 import os
 import re
+from itertools import islice
 
 from loguru import logger
 from patchright.async_api import Browser as PlaywrightBrowser
@@ -26,7 +27,15 @@ _PERCENT_RE = re.compile(r'([0-9]+(?:[.,][0-9]+)?)\s*%')
 def _parse_share_percent(s: str | None) -> float | None:
     if not s:
         return None
-    m = _PERCENT_RE.search(str(s))
+    s = str(s)
+    # Fast path: shares are almost always a bare "42.8%" / "42,8 %"
+    t = s.strip()
+    if t.endswith('%'):
+        num = t[:-1].rstrip().replace(',', '.')
+        digits = num.replace('.', '', 1)
+        if digits.isascii() and digits.isdigit() and num[0] != '.' and num[-1] != '.':
+            return float(num)
+    m = _PERCENT_RE.search(s)
     if not m:
         return None
     return float(m.group(1).replace(',', '.'))
@@ -44,24 +53,33 @@ def _is_konkursny(text: str | None) -> bool:
     # robust contains check (covers cases like "конкурсный управляющий", "и.о. конкурсного управляющего", etc.)
     return 'конкурсн' in t and 'управля' in t
 
+_SEARCH_PROBE_JS = """() => {
+    if (document.body.innerText.includes('Найдено 0 организаций')) return {empty: true, href: null};
+    const a = document.querySelector("a[href*='/company/']");
+    return {empty: false, href: a ? a.href : null};
+}"""
+
 async def _goto_search_and_validate(
     browser: Browser, value: str | int
-) -> tuple[Page, bool]:
+) -> tuple[Page, bool, str | None]:
     """
     Navigates to list-org.com search by INN or ORGN and handles captcha.
 
     Returns:
-        Tuple[Page, bool]: The page object and a boolean indicating if results were found.
+        Tuple[Page, bool, str | None]: The page object, a boolean indicating if results
+        were found, and the href of the first company link (if any). Both come from a
+        single in-page probe.
     """
     page = await browser.goto_with_retry(
         f"https://www.list-org.com/search?val={value}", wait_until="domcontentloaded"
     )
     await handle_captcha(page)
 
-    if await page.locator("p:has-text('Найдено 0 организаций')").count() > 0:
+    probe = await page.evaluate(_SEARCH_PROBE_JS)
+    if probe["empty"]:
         logger.warning(f"No organizations found for search value={value}")
-        return page, False
-    return page, True
+        return page, False, None
+    return page, True, probe["href"]
 
 async def run(
     browser: Browser,
@@ -95,7 +113,7 @@ async def run(
             if orgn is None or str(orgn).strip() in ("", "0"):
                 return {"data": "оргн пуст"}
 
-            page, found = await _goto_search_and_validate(browser, orgn)
+            page, found, _ = await _goto_search_and_validate(browser, orgn)
             if not found:
                 return {"data": "нет данных о компании"}
 
@@ -103,13 +121,16 @@ async def run(
             return {"data": data}
 
         # ---- INN-based modes ----
-        page, found = await _goto_search_and_validate(browser, inn)
+        page, found, company_href = await _goto_search_and_validate(browser, inn)
         if not found:
             return {"data": "нет данных о компании"}
         
         # Navigate to the company page
-        await page.locator("a[href*='/company/']").first.click()
-        await page.wait_for_load_state("domcontentloaded")
+        if company_href:
+            await page.goto(company_href, wait_until="domcontentloaded")
+        else:
+            await page.locator("a[href*='/company/']").first.click()
+            await page.wait_for_load_state("domcontentloaded")
         await handle_captcha(page)
 
         if method == 'finances':
@@ -181,19 +202,20 @@ async def run(
 
             # Founders (≥20%)
             for f in founders_list or []:
-                try:
-                    fname = (f.get("учредитель") or f.get("founder") or "").strip()
-                    share = _parse_share_percent(f.get("доля") or f.get("share_percent"))
-                    # keep only share >= 20%
-                    if not fname or share is None or share < 20.0:
-                        continue
-                    nkey = _normalize_name(fname)
-                    if nkey not in seen:
-                        ordered_names.append(fname)
-                        seen.add(nkey)
-                except Exception:
-                    # Be permissive; skip malformed rows
+                # Be permissive; skip malformed rows
+                if not isinstance(f, dict):
+                    continue
+                fname = str(f.get("учредитель") or f.get("founder") or "").strip()
+                if not fname:
                     continue
+                share = _parse_share_percent(f.get("доля") or f.get("share_percent"))
+                # keep only share >= 20%
+                if share is None or share < 20.0:
+                    continue
+                nkey = _normalize_name(fname)
+                if nkey not in seen:
+                    ordered_names.append(fname)
+                    seen.add(nkey)
 
             # 3) Run is_disqualified_on for each name on publish_date (dedicated page for nalog service)
             input_data: "OrderedDict[str, bool]" = OrderedDict()
@@ -243,14 +265,8 @@ async def run(
                 ceo_rdl = "нет"  # CEO skipped (конкурсный управляющий or missing)
 
             # Founders_RDL: any founder True
-            founders_any = False
-            # Slice everything after CEO if CEO included; otherwise from start
-            names_iter = list(input_data.items())
-            start_idx = 1 if include_ceo else 0
-            for _, val in names_iter[start_idx:]:
-                if val:
-                    founders_any = True
-                    break
+            # Skip the CEO (first entry) if included; otherwise from start
+            founders_any = any(islice(input_data.values(), 1 if include_ceo else 0, None))
             founders_rdl = "да" if founders_any else "нет"
 
             final_rdl = "да" if (ceo_rdl == "да" or founders_rdl == "да") else "нет"
@@ -1,6 +1,7 @@
 import asyncio
 import os
 import re
+import time
 from datetime import datetime, timezone
 from typing import Optional
 from loguru import logger
@@ -10,6 +11,19 @@ from .browser import Browser
 
 DATE_RX = re.compile(r"\b(\d{2}\.\d{2}\.\d{4})\b")
 
+_DETAILS_SELECTOR = "div.prop.prop--details"
+_EMPTY_SELECTOR = "#noData"
+
+# (normalized_name, date_str) -> (checked_at, result). The same person is often
+# both CEO and founder, and shows up again across INNs in a batch.
+_CACHE_TTL_SEC = 24 * 60 * 60
+_CACHE_MAX = 2048
+_cache: dict[tuple[str, str], tuple[float, bool]] = {}
+
+def _cache_key(name: str, date_str: str) -> tuple[str, str]:
+    # Collapse spaces, uppercase so "Иванов  иван" and "ИВАНОВ ИВАН" share an entry
+    return re.sub(r"\s+", " ", name or "").strip().upper(), date_str.strip()
+
 def _parse_ru_date(s: str) -> Optional[datetime]:
     m = DATE_RX.search(s or "")
     if not m:
@@ -26,7 +40,36 @@ async def is_disqualified_on(page: Page, name: str, date_str: str) -> bool:
     ranges found in valid 'prop prop--details' blocks on service.nalog.ru/disqualified.html.
     Inclusive comparison. If one date is missing -> open-ended interval.
     If no valid blocks found -> False.
+    Results are cached per (normalized name, date) for 24h; the page is not part of the key.
     """
+    key = _cache_key(name, date_str)
+    hit = _cache.get(key)
+    if hit is not None and time.monotonic() - hit[0] < _CACHE_TTL_SEC:
+        logger.debug(f"nalog.ru cache hit for '{name}' on {date_str}: {hit[1]}")
+        return hit[1]
+
+    result = await _search_disqualified(page, name, date_str)
+    _cache.pop(key, None)
+    if len(_cache) >= _CACHE_MAX:
+        # dicts keep insertion order -> drop the oldest entry
+        _cache.pop(next(iter(_cache)))
+    _cache[key] = (time.monotonic(), result)
+    return result
+
+def _in_range(target_date: datetime, start_dt: Optional[datetime], end_dt: Optional[datetime]) -> bool:
+    # Open-ended handling:
+    #  - missing start => (-inf, end]
+    #  - missing end   => [start, +inf)
+    if start_dt is None:
+        # effectively -inf
+        return target_date <= end_dt
+    if end_dt is None:
+        # effectively +inf
+        return target_date >= start_dt
+    return start_dt <= target_date <= end_dt  # inclusive
+
+async def _search_disqualified(page: Page, name: str, date_str: str) -> bool:
+    """Runs the actual nalog.ru search; see is_disqualified_on for semantics."""
     target_date = datetime.strptime(date_str, "%d.%m.%Y")
 
     # 1) Open page and perform search
@@ -45,14 +88,18 @@ async def is_disqualified_on(page: Page, name: str, date_str: str) -> bool:
         # If it never appeared or disappears quickly, ignore
         raise RuntimeError("Search results did not load in time or page structure changed.")
 
+    # Wait on results and the empty-state banner together so an empty search
+    # returns as soon as the page says so instead of burning the full timeout.
     try:
-        await page.locator("div.prop.prop--details").first.wait_for(timeout=2000)
+        first = await page.wait_for_selector(f"{_DETAILS_SELECTOR}, {_EMPTY_SELECTOR}", timeout=2000)
     except Exception:
         # No blocks at all => definitely False
         return False
+    if "prop--details" not in (await first.get_attribute("class") or ""):
+        return False
 
     # 2) Collect valid detail blocks (ignore the plain text fluke block)
-    blocks = page.locator("div.prop.prop--details")
+    blocks = page.locator(_DETAILS_SELECTOR)
     count = await blocks.count()
 
     valid_found = False
@@ -80,19 +127,7 @@ async def is_disqualified_on(page: Page, name: str, date_str: str) -> bool:
 
         valid_found = True
 
-        # Open-ended handling:
-        #  - missing start => (-inf, end]
-        #  - missing end   => [start, +inf)
-        if start_dt is None:
-            # effectively -inf
-            in_range = target_date <= end_dt
-        elif end_dt is None:
-            # effectively +inf
-            in_range = target_date >= start_dt
-        else:
-            in_range = (start_dt <= target_date <= end_dt)  # inclusive
-
-        if in_range:
+        if _in_range(target_date, start_dt, end_dt):
             return True
 
     # If we saw zero valid blocks (besides the fluke) -> False per spec
@@ -5,15 +5,16 @@
 # understanding the following points.
 #
 # --- How It Works ---
-# 1. A full Selenium browser session ("robot helper") visits the URL to appear
-#    like a real user and acquire valid session cookies ("library card").
-# 2. These cookies are then copied to a separate, lightweight `requests` session
-#    ("delivery drone").
+# 1. A page in the shared Playwright browser context ("robot helper") visits the
+#    URL to appear like a real user and acquire valid session cookies ("library card").
+#    If the browser receives the PDF itself (download / inline viewer), we use that.
+# 2. Otherwise these cookies are copied to a separate, lightweight `requests`
+#    session ("delivery drone").
 # 3. The `requests` session downloads the PDF using the copied cookies.
 #
 # --- How It Broke (The "Incident") ---
 # The script failed when we tried to make the `requests` call "smarter" by
-# adding a `User-Agent` header copied from the Selenium browser.
+# adding a `User-Agent` header copied from the browser.
 #
 # --- Why It Broke (Root Cause) ---
 # The server's security flagged an inconsistency. The `requests` library has its
@@ -29,149 +30,321 @@
 #
 # ======================================================================================
 
+import asyncio
+import logging
+import multiprocessing
+import os
 import random
+import tempfile
+import threading
 import time
-import logging
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional
-import sys
+from urllib.parse import urlsplit
 
+import pymupdf
 import requests
-from PyPDF2 import PdfReader
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.common.exceptions import WebDriverException, TimeoutException
-from webdriver_manager.chrome import ChromeDriverManager
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from patchright.async_api import Error as PlaywrightError
+from patchright.async_api import Download, Page, Route
+
+from .browser import Browser
 
 # Using the logger configured by the main FastAPI app
 logger = logging.getLogger("uvicorn.error")
 
+_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+_CHUNK_BYTES = 64 * 1024
+# Below this many pages process start-up costs more than it saves
+_PARALLEL_MIN_PAGES = 64
+_PARALLEL_WORKERS = min(4, os.cpu_count() or 1)
+_page_pool: Optional[ProcessPoolExecutor] = None
+# Extraction runs in asyncio.to_thread workers: guards the lazy pool creation
+_page_pool_lock = threading.Lock()
+# The warm-up page is only there for cookies; skip everything that only paints
+_BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "stylesheet", "media"})
+
 # --- NEW: Global session management ---
 _global_pdf_session: Optional["PDFSession"] = None
 # --- END NEW ---
 
-USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.5735.91 Safari/537.36",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_0) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.1 Safari/605.1.15",
-    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Windows NT 10.0; rv:109.0) Gecko/20100101 Firefox/115.0",
-]
+def _open_pdf(source: bytes | bytearray | str) -> pymupdf.Document:
+    if isinstance(source, str):
+        return pymupdf.open(source)
+    return pymupdf.open(stream=source, filetype="pdf")
+
+def _extract_page_range(source: bytes | bytearray | str, start: int, stop: int) -> list[str]:
+    # Runs in a worker process: reopen the document there, handles don't pickle
+    with _open_pdf(source) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+def _get_page_pool() -> ProcessPoolExecutor:
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            # spawn, not fork: this process already runs threads (uvicorn, Playwright),
+            # and a forked child can inherit one of their locks held forever
+            _page_pool = ProcessPoolExecutor(
+                max_workers=_PARALLEL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _page_pool
+
+def _extract_pdf_text(source: bytes | bytearray | str) -> str:
+    """
+    Extracts text page by page with PyMuPDF (C core, much faster than PyPDF2).
+    `source` is the PDF bytes or a path to a PDF file. Large documents are split
+    into page ranges across a process pool.
+    """
+    with _open_pdf(source) as doc:
+        page_count = doc.page_count
+        if page_count < _PARALLEL_MIN_PAGES or _PARALLEL_WORKERS < 2:
+            return "\n".join(page.get_text() for page in doc).strip()
+
+    pool = _get_page_pool()
+    step = -(-page_count // _PARALLEL_WORKERS)
+    futures = [
+        pool.submit(_extract_page_range, source, start, min(start + step, page_count))
+        for start in range(0, page_count, step)
+    ]
+    return "\n".join(text for future in futures for text in future.result()).strip()
+
+def _read_pdf_text(response: requests.Response) -> Optional[str]:
+    """
+    Reads a streamed response and extracts its text. Non-PDF bodies are never
+    downloaded; PDFs above _SPOOL_MAX_BYTES go through a temp file instead of memory.
+    """
+    content_type = response.headers.get("Content-Type", "").lower()
+    if not content_type.startswith("application/pdf"):
+        return None
+    # Spool by bytes actually received, not Content-Length (absent on chunked responses).
+    # Like SpooledTemporaryFile, but rolling over to a named file: the page-range
+    # workers reopen a large PDF by path.
+    chunks = response.iter_content(_CHUNK_BYTES)
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        if len(buf) > _SPOOL_MAX_BYTES:
+            break
+    else:
+        # PyMuPDF reads a bytearray stream as is, no need for a bytes copy
+        return _extract_pdf_text(buf) or None
+
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(buf)
+            buf = None  # drop the in-memory part before streaming the rest
+            for chunk in chunks:
+                f.write(chunk)
+        return _extract_pdf_text(path) or None
+    finally:
+        os.remove(path)
+
+async def _block_assets(route: Route):
+    if route.request.resource_type in _BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
 
 class PDFSession:
-    def __init__(self, wait_sec: float = 15, headless: bool = True, retries: int = 2):
+    def __init__(self, browser: Browser, wait_sec: float = 15, retries: int = 2, max_idle_pages: int = 4):
+        # Keep the wrapper, not its context: Browser swaps the context when it
+        # switches to a proxy.
+        self.browser = browser
         self.wait_sec = wait_sec
-        self.headless = headless
         self.retries = retries
-        self.driver = self._init_browser(headless=self.headless)
-    
-    def _init_browser(self, headless: bool):
-        chrome_options = Options()
-        if headless:
-            chrome_options.add_argument("--headless=new")
-        
-        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--lang=ru-RU")
-        chrome_options.add_argument("--disable-extensions")
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--disable-infobars")
-        chrome_options.add_argument("--ignore-certificate-errors")
-
-        user_agent = random.choice(USER_AGENTS)
-        chrome_options.add_argument(f"user-agent={user_agent}")
-        logger.info(f"Using user-agent: {user_agent}")
+        # One session for all downloads so TLS connections are kept alive between PDFs
+        self.req = requests.Session()
+        # Transient network/5xx errors are retried here, without re-warming cookies
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=16,
+            max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504], raise_on_status=False),
+        )
+        self.req.mount("https://", adapter)
+        self.req.mount("http://", adapter)
+        # Warm pages reused across URLs instead of opening a new tab per PDF
+        self.max_idle_pages = max_idle_pages
+        self._idle_pages: list[Page] = []
+
+    async def _acquire_page(self) -> Page:
+        context = self.browser.context
+        while self._idle_pages:
+            page = self._idle_pages.pop()
+            # Pages from a context that was replaced (proxy switch) are stale
+            if not page.is_closed() and page.context is context:
+                return page
+            if not page.is_closed():
+                await page.close()
+        page = await context.new_page()
+        await page.route("**/*", _block_assets)
+        return page
+
+    async def _release_page(self, page: Page):
+        if page.is_closed():
+            return
+        if len(self._idle_pages) < self.max_idle_pages and page.context is self.browser.context:
+            self._idle_pages.append(page)
+        else:
+            await page.close()
 
+    async def _browser_fetch(self, url: str, attempt: int) -> tuple[Optional[str], list[dict]]:
+        """
+        Visits the URL in the shared Playwright context.
+
+        If the browser itself receives the PDF (as a download, or inline in a
+        headful PDF viewer) its text is returned straight away — real browser
+        request, real fingerprint, no second download. Otherwise returns the
+        context's cookies for the `requests` fallback. The first attempt grabs
+        cookies right away; retries wait until the page has gone network-idle
+        (at most wait_sec, doubling per retry) so the site's anti-bot checks can
+        finish setting cookies.
+        """
+        page = await self._acquire_page()
+        downloads: list[Download] = []
+        on_download = downloads.append
+        page.on("download", on_download)
         try:
-            logger.info("Initializing new browser instance...")
-            driver = webdriver.Chrome(
-                service=Service(ChromeDriverManager().install()), 
-                options=chrome_options
-            )
-            logger.info("Browser instance initialized.")
-            return driver
-        except WebDriverException as e:
-            logger.warning("Headless browser failed. Trying headful mode.")
-            if headless:
-                return self._init_browser(headless=False)
-            else:
-                raise e
-
-    def _simulate_wait(self):
-        sleep_time = self.wait_sec + random.uniform(0.5, 2.5)
-        logger.info(f"Sleeping for {sleep_time:.2f} seconds")
-        time.sleep(sleep_time)
+            response = None
+            try:
+                response = await page.goto(url, wait_until="domcontentloaded")
+            except PlaywrightError as e:
+                # Chromium turns a PDF response into a download and aborts goto
+                if "download is starting" not in str(e).lower():
+                    raise
+                if not downloads:
+                    downloads.append(await page.wait_for_event("download", timeout=5000))
+
+            if downloads:
+                text = await self._download_event_text(downloads[0])
+                if text:
+                    return text, []
+            elif response is not None and response.headers.get("content-type", "").lower().startswith("application/pdf"):
+                body = await response.body()
+                text = await asyncio.to_thread(_extract_pdf_text, body)
+                if text:
+                    return text, []
+
+            if attempt > 1:
+                await self._wait_until_ready(page, attempt)
+            return None, await page.context.cookies(url)
+        finally:
+            page.remove_listener("download", on_download)
+            await self._release_page(page)
+
+    @staticmethod
+    async def _download_event_text(download: Download) -> Optional[str]:
+        try:
+            path = await download.path()
+            if path is None:
+                return None
+            return await asyncio.to_thread(_extract_pdf_text, str(path)) or None
+        finally:
+            await download.delete()
+
+    async def _wait_until_ready(self, page: Page, attempt: int):
+        timeout_sec = self.wait_sec * 2 ** (attempt - 2)
+        started = time.monotonic()
+        try:
+            await page.wait_for_load_state("networkidle", timeout=timeout_sec * 1000)
+        except PlaywrightError:
+            # Still busy (or the navigation became a download): take the cookies we have
+            pass
+        # A little human-ish jitter on top of the real readiness signal
+        await asyncio.sleep(random.uniform(0.2, 0.6))
+        logger.info(f"Waited {time.monotonic() - started:.2f}s for the page to settle")
 
     def close(self):
-        if self.driver:
-            logger.info("Closing browser instance...")
-            self.driver.quit()
-            logger.info("Browser instance closed.")
+        # The browser context (and so the pooled pages) belongs to the Browser wrapper;
+        # only the HTTP pool is ours.
+        self._idle_pages.clear()
+        self.req.close()
+
+    def _download_text(self, url: str, cookies: Optional[dict] = None) -> tuple[int, Optional[str]]:
+        """Blocking download + extraction (run it in a thread). Returns (status, text)."""
+        with self.req.get(url, cookies=cookies, timeout=20, stream=True) as response:
+            return response.status_code, _read_pdf_text(response)
+
+    async def fetch_pdf_content(self, url: str) -> Optional[str]:
+        # Many PDF links are served directly: try a plain request first and only
+        # warm cookies in the browser if it's refused. Same bare defaults (Golden Rule).
+        try:
+            _, final_text = await asyncio.to_thread(self._download_text, url)
+            if final_text:
+                logger.info(f"Plain download successful: {url}")
+                return final_text
+        except Exception as e:
+            # Network errors, but also a truncated/corrupt PDF that PyMuPDF can't open:
+            # either way the browser path may still get a good copy
+            logger.info(f"Plain download failed ({e}), warming cookies in the browser")
 
-    def fetch_pdf_content(self, url: str) -> Optional[str]:
         for attempt in range(1, self.retries + 1):
             try:
                 logger.info(f"[Attempt {attempt}] Navigating to {url}")
-                self.driver.get(url)
-                self._simulate_wait()
-
-                cookies = self.driver.get_cookies()
-                session = requests.Session()
-                for cookie in cookies:
-                    session.cookies.set(cookie["name"], cookie["value"])
+                final_text, cookies = await self._browser_fetch(url, attempt)
+                if final_text:
+                    logger.info(f"Browser download successful: {url}")
+                    return final_text
 
-                response = session.get(url, timeout=20)
-                content_type = response.headers.get("Content-Type", "").lower()
-                
-                if content_type.startswith("application/pdf"):
-                    reader = PdfReader(BytesIO(response.content))
-                    texts = [page.extract_text() or "" for page in reader.pages]
-                    final_text = "\n".join(texts).strip()
-                    if final_text:
-                        logger.info(f"Direct download successful: {url}")
-                        return final_text
+                # Per-request cookies instead of mutating the shared jar, so
+                # concurrent fetches don't see each other's cookies.
+                jar = {cookie["name"]: cookie["value"] for cookie in cookies}
+                status, final_text = await asyncio.to_thread(self._download_text, url, jar)
+                if final_text:
+                    logger.info(f"Direct download successful: {url}")
+                    return final_text
                 
+                if status >= 500:
+                    # Server-side failure the adapter already retried; new cookies won't fix it
+                    logger.error(f"Direct download failed with status {status}.")
+                    break
+                # Anything else (403, HTML challenge page) means the cookies weren't accepted
                 logger.error("Direct download failed.")
 
-            except (WebDriverException, TimeoutException, requests.RequestException) as e:
+            except requests.RequestException as e:
+                # The adapter already retried transient errors; re-warming cookies won't help
+                logger.error(f"Attempt {attempt} failed: {str(e)}")
+                break
+            except PlaywrightError as e:
                 logger.error(f"Attempt {attempt} failed: {str(e)}")
-                self._simulate_wait()
             except Exception as e:
                 logger.error(f"Unexpected error: {str(e)}")
-                self._simulate_wait()
         
         logger.error(f"All attempts failed for: {url}")
         return None
 
 # --- NEW: Functions to manage the global session ---
-def get_global_pdf_session() -> PDFSession:
+def get_global_pdf_session(browser: Browser) -> PDFSession:
     """
     Initializes the global PDFSession if it doesn't exist, and returns it.
-    This is lazy initialization - the browser only starts on the first request.
+    The session reuses the given (already launched) Playwright browser.
     """
     global _global_pdf_session
-    if _global_pdf_session is None:
-        _global_pdf_session = PDFSession(wait_sec=5, headless=True)
+    if _global_pdf_session is None or _global_pdf_session.browser is not browser:
+        _global_pdf_session = PDFSession(browser, wait_sec=5)
     return _global_pdf_session
 
 def close_global_pdf_session():
     """Closes the global PDF session if it was initialized."""
-    global _global_pdf_session
+    global _global_pdf_session, _page_pool
     if _global_pdf_session is not None:
         _global_pdf_session.close()
         _global_pdf_session = None
+    with _page_pool_lock:
+        if _page_pool is not None:
+            _page_pool.shutdown(cancel_futures=True)
+            _page_pool = None
 
-def extract_text_from_url(url: str) -> dict:
+async def extract_text_from_url(browser: Browser, url: str) -> dict:
     """
     A wrapper function to extract text from a PDF URL using the GLOBAL PDFSession.
     """
     try:
         # Get the single, shared browser session
-        session = get_global_pdf_session()
-        pdf_text = session.fetch_pdf_content(url)
+        session = get_global_pdf_session(browser)
+        pdf_text = await session.fetch_pdf_content(url)
         if pdf_text:
             return {"success": True, "text": pdf_text}
         else:
@@ -179,4 +352,22 @@ def extract_text_from_url(url: str) -> dict:
     except Exception as e:
         logger.error(f"An exception occurred in the extraction process for {url}: {e}")
         return {"success": False, "error": f"An internal error occurred: {str(e)}"}
+
+async def extract_text_from_urls(
+    browser: Browser, urls: list[str], max_workers: int = 4, per_host: int = 2
+) -> list[dict]:
+    """
+    Extracts text from many PDF URLs concurrently through the GLOBAL PDFSession.
+    At most `max_workers` fetches run at once, and at most `per_host` against the
+    same host to stay under site rate limits. Results keep the order of `urls`.
+    """
+    overall = asyncio.Semaphore(max_workers)
+    hosts: dict[str, asyncio.Semaphore] = {}
+
+    async def one(url: str) -> dict:
+        host_sem = hosts.setdefault(urlsplit(url).netloc, asyncio.Semaphore(per_host))
+        async with host_sem, overall:
+            return await extract_text_from_url(browser, url)
+
+    return await asyncio.gather(*(one(url) for url in urls))
 # --- END NEW ---
\ No newline at end of file
@@ -8,7 +8,15 @@ enrich with RDL results, and writes a copy to an output file (input_outN.json).
 Key behaviors:
 - Does NOT modify the input file.
 - Creates output file with suffix _out1 (or _out2, ... if exists).
-- Saves progress after EACH processed auction via atomic write (temp -> rename).
+- Calls the API for up to MAX_CONCURRENCY auctions at once (shared httpx client).
+- Appends each processed auction to a journal (<output>.jsonl) — O(1) per auction.
+- Compacts into the full output JSON via atomic write (temp -> rename), coalesced by
+  Checkpointer (every CHECKPOINT_EVERY auctions or CHECKPOINT_INTERVAL_SECS) and once
+  at the end, after which the journal is removed. Writes run off-thread via
+  asyncio.to_thread — portable (this also runs on Windows), so no io_uring path;
+  the per-auction journal append is a single small write and stays on the loop.
+- An interrupted run leaves its journal behind; the next run picks the same output
+  path, replays the journal and continues where it stopped.
 - Skips auctions that already have a definitive 'final_RDL' value.
 - Retries auctions with empty or 'error' results.
 - If required fields are missing, writes 'final_RDL': 'недостаточно данных: ...'
@@ -17,6 +25,9 @@ Key behaviors:
 
 API shape (GET):
   http://127.0.0.1:8000/company_rdl/{inn}?publish_date=dd.mm.yyyy
+Batch (POST, used when available — see RdlBatcher):
+  http://127.0.0.1:8000/company_rdl/batch  body: [{"inn": ..., "publish_date": ...}, ...]
+  -> {"success": true, "data": [{"status_code": 200, "success": true, "data": {...}}, ...]}
 Response (success):
 {
   "success": true,
@@ -32,15 +43,16 @@ Response (success):
 
 from __future__ import annotations
 
+import asyncio
+import functools
 import time
 import json
 import os
-import re
 import sys
 from datetime import datetime
 from typing import Any, Dict, Optional, Tuple
 
-import requests
+import httpx
 from loguru import logger
 
 
@@ -48,6 +60,23 @@ from loguru import logger
 
 API_BASE = "http://127.0.0.1:8000/company_rdl"
 API_TIMEOUT_SECS = 600
+# 1 by default: the API serves every lookup from one shared browser, and a proxy switch
+# there relaunches its context under the pages of the other in-flight lookups
+MAX_CONCURRENCY = 1
+API_RETRIES = 2
+API_RETRY_STATUSES = {502, 503, 504}
+API_RETRY_BACKOFF_SECS = 0.3
+# Coalesce lookups into POST {API_BASE}/batch; falls back to per-INN GET if missing.
+# Only used with concurrency > 1
+USE_BATCH_API = True
+BATCH_SIZE = 32
+BATCH_WAIT_SECS = 0.05
+# Full-file compaction only; per-auction durability comes from the journal
+CHECKPOINT_EVERY = 500
+CHECKPOINT_INTERVAL_SECS = 60.0
+JOURNAL_SUFFIX = ".jsonl"
+
+_TERMINAL_PREFIXES = ("недостаточно данных", "пропуск")
 
 LOGS_DIR = "logs"
 LOG_FILE = os.path.join(LOGS_DIR, "rdl_updater.log")
@@ -67,21 +96,30 @@ def ensure_logs():
 def determine_output_path(input_path: str) -> str:
     """
     Choose output path by appending _out1, _out2, ... before the .json extension.
+    An output that still has a journal next to it is an unfinished run: reuse it.
     """
     base, ext = os.path.splitext(input_path)
     n = 1
     while True:
         candidate = f"{base}_out{n}{ext or '.json'}"
-        if not os.path.exists(candidate):
+        if not os.path.exists(candidate) or os.path.exists(candidate + JOURNAL_SUFFIX):
             return candidate
         n += 1
 
 
 def atomic_write_json(obj: Any, target_path: str, retries: int = 5, delay: float = 0.2):
+    atomic_write_text(json.dumps(obj, ensure_ascii=False, indent=2), target_path, retries, delay)
+
+
+def atomic_write_text(text: str, target_path: str, retries: int = 5, delay: float = 0.2):
+    """
+    Write already-serialized text to target_path via temp file + rename.
+    Safe to run in a worker thread (doesn't touch the live object).
+    """
     dir_ = os.path.dirname(os.path.abspath(target_path)) or "."
     tmp_path = os.path.join(dir_, f".{os.path.basename(target_path)}.tmp")
     with open(tmp_path, "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
+        f.write(text)
 
     for attempt in range(1, retries + 1):
         try:
@@ -93,30 +131,90 @@ def atomic_write_json(obj: Any, target_path: str, retries: int = 5, delay: float
             time.sleep(delay)
 
 
+class Checkpointer:
+    """
+    Debounces atomic_write_json for a live object: maybe_flush() only writes when
+    enough changes piled up or enough time passed; flush() forces a write.
+    """
+
+    def __init__(self, target_path: str, every: int = CHECKPOINT_EVERY, interval: float = CHECKPOINT_INTERVAL_SECS):
+        self.target_path = target_path
+        self.every = every
+        self.interval = interval
+        self.pending = 0
+        self.last_write_ts = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def maybe_flush(self, obj: Any):
+        self.pending += 1
+        if self.pending >= self.every or time.monotonic() - self.last_write_ts >= self.interval:
+            await self.flush(obj)
+
+    async def flush(self, obj: Any):
+        if not self.pending:
+            return
+        # Serialize on the loop thread (no task mutates obj mid-dump), write off-thread.
+        # The lock is FIFO, so snapshots land on disk in the order they were taken.
+        text = json.dumps(obj, ensure_ascii=False, indent=2)
+        self.pending = 0
+        self.last_write_ts = time.monotonic()
+        async with self._lock:
+            await asyncio.to_thread(atomic_write_text, text, self.target_path)
+
+
+def replay_journal(auctions: list, journal_path: str) -> int:
+    """
+    Apply journal records ({"i": index, "lot_link": ..., "auction": {...}}) onto
+    auctions in place. Records that don't line up with the input are ignored.
+    Returns the number of applied records.
+    """
+    if not os.path.exists(journal_path):
+        return 0
+    applied = 0
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # Torn last line from a crash mid-write
+                continue
+            i = rec.get("i")
+            if not isinstance(i, int) or not 0 <= i < len(auctions):
+                continue
+            if auctions[i].get("lot_link") != rec.get("lot_link"):
+                continue
+            auctions[i] = rec.get("auction") or auctions[i]
+            applied += 1
+    return applied
+
+
 def convert_publish_date(date_str: str) -> Optional[str]:
     """
     Convert 'dd-mm-yyyy' -> 'dd.mm.yyyy'. If already 'dd.mm.yyyy', return as-is.
-    Returns None if parsing fails.
+    Returns None if parsing fails. Cached: auctions often share publish dates.
     """
     if not isinstance(date_str, str):
         return None
+    return _convert_publish_date_str(date_str)
+
 
-    # Already with dots?
-    if re.fullmatch(r"\d{2}\.\d{2}\.\d{4}", date_str):
-        return date_str
+@functools.lru_cache(maxsize=2048)
+def _convert_publish_date_str(date_str: str) -> Optional[str]:
+    # Fixed layout dd?mm?yyyy with any non-digit separators (covers dots and hyphens):
+    # plain slicing, no regex
+    if len(date_str) == 10:
+        d, m, y = date_str[:2], date_str[3:5], date_str[6:]
+        sep1, sep2 = date_str[2], date_str[5]
+        if (d + m + y).isascii() and (d + m + y).isdigit() and not sep1.isdigit() and not sep2.isdigit():
+            return f"{d}.{m}.{y}"
 
-    # Try hyphen format
+    # Slow path for looser input, e.g. '1-2-2024'
     try:
         dt = datetime.strptime(date_str, "%d-%m-%Y")
         return dt.strftime("%d.%m.%Y")
     except Exception:
         pass
 
-    # Last-chance: try to normalize non-digit separators to dots if obviously dd?mm?yyyy
-    m = re.fullmatch(r"(\d{2})\D(\d{2})\D(\d{4})", date_str)
-    if m:
-        return f"{m.group(1)}.{m.group(2)}.{m.group(3)}"
-
     return None
 
 
@@ -151,6 +249,7 @@ def current_final_value(auction: Dict[str, Any]) -> Optional[str]:
     return None
 
 
+@functools.lru_cache(maxsize=1024)
 def is_terminal_insufficient(val: Optional[str]) -> bool:
     """
     Treat terminal statuses as skip-forever:
@@ -159,8 +258,7 @@ def is_terminal_insufficient(val: Optional[str]) -> bool:
     """
     if not val:
         return False
-    s = val.lower()
-    return s.startswith("недостаточно данных") or s.startswith("пропуск")
+    return val.lower().startswith(_TERMINAL_PREFIXES)
 
 def should_skip(auction: Dict[str, Any]) -> bool:
     """
@@ -177,31 +275,21 @@ def should_skip(auction: Dict[str, Any]) -> bool:
     return val.lower() != "error"  # skip if not 'error'
 
 
-def call_rdl_api(inn: str, publish_date_dot: str) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str]]:
+def interpret_rdl_response(status_code: int, payload: Any) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str]]:
     """
-    Returns: (ok, data_dict_or_none, error_message_or_none)
+    Map one API answer (HTTP status + decoded JSON body, None if not JSON) to
+    (ok, data_dict_or_none, error_message_or_none). Shared by the per-INN GET and
+    the items of a batch response.
     """
-    url = f"{API_BASE}/{inn}"
-    try:
-        resp = requests.get(url, params={"publish_date": publish_date_dot}, timeout=API_TIMEOUT_SECS)
-    except requests.RequestException as e:
-        return False, None, f"request_failed: {e}"
-
-    if not resp.ok:
+    if not 200 <= status_code < 300:
         # Inspect JSON error for specific INN-length failure returned as HTTP 500
-        try:
-            err_payload = resp.json()
-            if resp.status_code == 500 and isinstance(err_payload, dict):
-                detail = str(err_payload.get("detail", ""))
-                if "INN must be 9 or 10 digits long" in detail:
-                    return False, None, "inn_too_long"
-        except ValueError:
-            pass
-        return False, None, f"http_{resp.status_code}"
+        if status_code == 500 and isinstance(payload, dict):
+            detail = str(payload.get("detail", ""))
+            if "INN must be 9 or 10 digits long" in detail:
+                return False, None, "inn_too_long"
+        return False, None, f"http_{status_code}"
 
-    try:
-        payload = resp.json()
-    except ValueError:
+    if payload is None:
         return False, None, "invalid_json"
 
     if not isinstance(payload, dict) or not payload.get("success"):
@@ -217,7 +305,119 @@ def call_rdl_api(inn: str, publish_date_dot: str) -> Tuple[bool, Optional[Dict[s
     return True, data, None
 
 
-def enrich_auction(auction: Dict[str, Any]) -> str:
+async def call_rdl_api(
+    client: httpx.AsyncClient, inn: str, publish_date_dot: str
+) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Returns: (ok, data_dict_or_none, error_message_or_none)
+    """
+    url = f"{API_BASE}/{inn}"
+    try:
+        for attempt in range(API_RETRIES + 1):
+            resp = await client.get(url, params={"publish_date": publish_date_dot})
+            if resp.status_code not in API_RETRY_STATUSES or attempt == API_RETRIES:
+                break
+            await asyncio.sleep(API_RETRY_BACKOFF_SECS * 2 ** attempt)
+    except httpx.HTTPError as e:
+        return False, None, f"request_failed: {e}"
+
+    try:
+        payload = resp.json()
+    except ValueError:
+        payload = None
+    return interpret_rdl_response(resp.status_code, payload)
+
+
+class RdlBatcher:
+    """
+    Coalesces RDL lookups into POST {API_BASE}/batch calls: requests queue up and
+    are sent together once BATCH_SIZE are waiting or BATCH_WAIT_SECS passed since
+    the first one. If the server has no batch endpoint (404/405), batching is
+    switched off and every lookup goes through call_rdl_api (per-INN GET).
+    """
+
+    def __init__(self, client: httpx.AsyncClient, enabled: bool = True,
+                 max_batch: int = BATCH_SIZE, max_wait: float = BATCH_WAIT_SECS):
+        self.client = client
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._collector: Optional[asyncio.Task] = None
+        self._senders: set = set()
+
+    async def call(self, inn: str, publish_date_dot: str) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str]]:
+        if not self.enabled:
+            return await call_rdl_api(self.client, inn, publish_date_dot)
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((inn, publish_date_dot, fut))
+        if self._collector is None:
+            self._collector = asyncio.create_task(self._collect())
+        return await fut
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Send in the background so the next batch can start filling up
+            task = asyncio.create_task(self._send(batch))
+            self._senders.add(task)
+            task.add_done_callback(self._senders.discard)
+
+    async def _send(self, batch: list):
+        try:
+            results = await self._post(batch)
+        except Exception as e:
+            results = [(False, None, f"request_failed: {e}")] * len(batch)
+        for (_, _, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
+
+    async def _post(self, batch: list) -> list:
+        if not self.enabled:
+            return await asyncio.gather(*(call_rdl_api(self.client, inn, d) for inn, d, _ in batch))
+
+        body = [{"inn": inn, "publish_date": d} for inn, d, _ in batch]
+        try:
+            resp = await self.client.post(f"{API_BASE}/batch", json=body)
+        except httpx.HTTPError as e:
+            return [(False, None, f"request_failed: {e}")] * len(batch)
+
+        if resp.status_code in (404, 405):
+            logger.warning("RDL batch endpoint not available; falling back to per-INN requests")
+            self.enabled = False
+            return await self._post(batch)
+        if not resp.is_success:
+            return [(False, None, f"http_{resp.status_code}")] * len(batch)
+
+        try:
+            items = resp.json().get("data")
+        except (ValueError, AttributeError):
+            items = None
+        if not isinstance(items, list) or len(items) != len(batch):
+            return [(False, None, "invalid_json")] * len(batch)
+        return [
+            interpret_rdl_response(item.get("status_code", 500), item) if isinstance(item, dict)
+            else (False, None, "invalid_data")
+            for item in items
+        ]
+
+    async def aclose(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+
+
+async def enrich_auction(rdl: RdlBatcher, auction: Dict[str, Any]) -> str:
     """
     Process a single auction dict in place.
     Returns a status string for logging: 'skipped', 'updated', 'error', or 'insufficient'.
@@ -255,7 +455,7 @@ def enrich_auction(auction: Dict[str, Any]) -> str:
         return "insufficient"
 
     # Call API
-    ok, data, err = call_rdl_api(inn, publish_date_dot)
+    ok, data, err = await rdl.call(inn, publish_date_dot)
     if not ok or not data:
         if err == "no_company_data":
             reason = "нет данных о компании"
@@ -276,7 +476,11 @@ def enrich_auction(auction: Dict[str, Any]) -> str:
     return "updated"
 
 
-def process_file(input_path: str, output_path: str):
+def process_file(input_path: str, output_path: str, concurrency: int = MAX_CONCURRENCY):
+    asyncio.run(process_file_async(input_path, output_path, concurrency))
+
+
+async def process_file_async(input_path: str, output_path: str, concurrency: int = MAX_CONCURRENCY):
     with open(input_path, "r", encoding="utf-8") as f:
         src = json.load(f)
 
@@ -285,17 +489,35 @@ def process_file(input_path: str, output_path: str):
 
     total = len(out["auctions"])
     logger.info(f"Loaded {total} auctions from: {input_path}")
-    logger.info(f"Writing output to: {output_path}")
+    logger.info(f"Writing output to: {output_path} (concurrency={concurrency})")
+
+    # Resume: results of an interrupted run into the same output
+    journal_path = output_path + JOURNAL_SUFFIX
+    resumed = replay_journal(out["auctions"], journal_path)
+    if resumed:
+        logger.info(f"Resumed {resumed} auctions from journal: {journal_path}")
 
     # Initial write (copy) so the file exists even if we crash immediately
     atomic_write_json(out, output_path)
 
-    for idx, auction in enumerate(out["auctions"], start=1):
+    # One pass to drop finished auctions up front instead of spawning a task each
+    pending = [(idx, a) for idx, a in enumerate(out["auctions"], start=1) if not should_skip(a)]
+    logger.info(f"Skipping {total - len(pending)} auctions with a final result; {len(pending)} to process")
+
+    sem = asyncio.Semaphore(concurrency)
+    checkpointer = Checkpointer(output_path)
+    journal = open(journal_path, "a", encoding="utf-8")
+    if journal.tell():
+        # Start on a fresh line in case the previous run died mid-record (blank lines are skipped)
+        journal.write("\n")
+
+    async def worker(idx: int, auction: Dict[str, Any], rdl: RdlBatcher):
         ident = auction.get("lot_link") or f"auction#{idx}"
-        pre_status = current_final_value(auction)
-        logger.info(f"[{idx}/{total}] Processing {ident} | pre-final={pre_status!r}")
+        async with sem:
+            pre_status = current_final_value(auction)
+            logger.info(f"[{idx}/{total}] Processing {ident} | pre-final={pre_status!r}")
 
-        status = enrich_auction(auction)
+            status = await enrich_auction(rdl, auction)
 
         if status == "skipped":
             logger.info(f"[{idx}/{total}] SKIP {ident}")
@@ -306,9 +528,34 @@ def process_file(input_path: str, output_path: str):
         else:  # error
             logger.error(f"[{idx}/{total}] ERROR {ident} | final={auction.get('final_RDL')!r}")
 
-        # Save progress atomically after each auction
-        atomic_write_json(out, output_path)
-
+        # Save progress: journal line now, full compaction debounced
+        if status != "skipped":
+            rec = {"i": idx - 1, "lot_link": auction.get("lot_link"), "auction": auction}
+            journal.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            journal.flush()
+            await checkpointer.maybe_flush(out)
+
+    # One keep-alive pool for the whole run; the transport retries failed connects.
+    # (No HTTP/2: the local uvicorn server only speaks HTTP/1.1.)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    transport = httpx.AsyncHTTPTransport(retries=API_RETRIES, limits=limits)
+    try:
+        async with httpx.AsyncClient(timeout=API_TIMEOUT_SECS, transport=transport) as client:
+            # Workers hold the semaphore while they wait, so a batch never holds more than
+            # `concurrency` lookups; with one there is nothing to coalesce, only BATCH_WAIT_SECS to lose
+            rdl = RdlBatcher(client, enabled=USE_BATCH_API and concurrency > 1)
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    for idx, auction in pending:
+                        tg.create_task(worker(idx, auction, rdl))
+            finally:
+                await rdl.aclose()
+    finally:
+        journal.close()
+        await checkpointer.flush(out)
+
+    # Everything is in the output file now; a leftover journal would mean "resume me"
+    os.remove(journal_path)
     logger.info("Done.")
 
 
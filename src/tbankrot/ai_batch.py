@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline ("batch") enrichment for bulk backfills over lot_details files.
+
+Instead of one chat call per lot, all prompts are uploaded as one JSONL file to an
+OpenAI-compatible Batch API (`/files` + `/batches`). The provider runs them within the
+completion window (hours, not seconds), at a discount and outside the regular rate limits.
+Results are applied with the same parsing/normalization as `update_debtor_all`.
+
+OpenRouter itself has no `/files` / `/batches` endpoints, so batch jobs go to the provider
+set via BATCH_API_BASE / BATCH_APIKEY / BATCH_MODEL in `.env` (OpenAI by default).
+
+    python -m src.tbankrot.ai_batch submit            # prints and saves the batch id
+    python -m src.tbankrot.ai_batch collect <id>      # waits, merges results into OUTPUT_FILE
+                                                      # (by lot url, other lots there are kept)
+"""
+
+import copy
+import os
+import sys
+import time
+from typing import Any, Dict, Optional, Set
+
+import orjson
+import requests
+from dotenv import load_dotenv
+from loguru import logger
+
+from .ai_request import (
+    DEBTOR_KEYS,
+    _all_prompt,
+    _apply_all_content,
+    _ensure_flag_defaults,
+    _ensure_lists_in_data,
+)
+from .enrich_lot_details import INPUT_FILE, OUTPUT_FILE, load_json, save_json
+
+load_dotenv()
+BATCH_API_BASE = os.getenv("BATCH_API_BASE", "https://api.openai.com/v1").rstrip("/")
+BATCH_API_KEY = os.getenv("BATCH_APIKEY")
+BATCH_MODEL = os.getenv("BATCH_MODEL", "gpt-4o-mini")
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_ID_FILE = "debug/ai_batch_id.txt"
+POLL_INTERVAL_SECS = 60
+_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def _session() -> requests.Session:
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {BATCH_API_KEY}"
+    return session
+
+
+def build_batch_jsonl(items: Dict[str, Dict[str, Any]]) -> bytes:
+    """One chat-completions request per lot; custom_id is the key in items."""
+    lines = []
+    for custom_id, data in items.items():
+        body = {
+            "model": BATCH_MODEL,
+            "messages": [{"role": "user", "content": _all_prompt(data.get("announcement_text") or "")}],
+        }
+        lines.append(orjson.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": body,
+        }))
+    return b"\n".join(lines) + b"\n"
+
+
+def submit_batch(items: Dict[str, Dict[str, Any]]) -> str:
+    """Uploads the prompts for items (custom_id -> lot data) and starts a batch. Returns the batch id."""
+    if not BATCH_API_KEY:
+        raise RuntimeError("BATCH_APIKEY is not set")
+
+    jsonl = build_batch_jsonl(items)
+    with _session() as s:
+        r = s.post(
+            f"{BATCH_API_BASE}/files",
+            files={"file": ("lots.jsonl", jsonl, "application/jsonl")},
+            data={"purpose": "batch"},
+            timeout=300,
+        )
+        r.raise_for_status()
+        file_id = r.json()["id"]
+
+        r = s.post(
+            f"{BATCH_API_BASE}/batches",
+            json={
+                "input_file_id": file_id,
+                "endpoint": "/v1/chat/completions",
+                "completion_window": BATCH_COMPLETION_WINDOW,
+            },
+            timeout=60,
+        )
+        r.raise_for_status()
+        batch_id = r.json()["id"]
+
+    logger.info(f"Submitted batch {batch_id}: {len(items)} requests, file {file_id} ({len(jsonl)} bytes)")
+    return batch_id
+
+
+def collect_batch(
+    batch_id: str,
+    items: Dict[str, Dict[str, Any]],
+    poll_interval: float = POLL_INTERVAL_SECS,
+    applied_ids: Optional[Set[str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Polls until the batch is finished, then applies each result to items[custom_id]
+    exactly like update_debtor_all. Lots without a usable result are left untouched,
+    so they still look unclassified to enrich_lot_details.
+    custom_ids whose result was applied are added to applied_ids, if given.
+    Mutates and returns items.
+    """
+    with _session() as s:
+        while True:
+            r = s.get(f"{BATCH_API_BASE}/batches/{batch_id}", timeout=60)
+            r.raise_for_status()
+            batch = r.json()
+            status = batch.get("status")
+            if status in _TERMINAL_STATUSES:
+                break
+            logger.info(f"Batch {batch_id}: {status}, counts={batch.get('request_counts')}")
+            time.sleep(poll_interval)
+
+        output_file_id = batch.get("output_file_id")
+        if status != "completed" or not output_file_id:
+            logger.error(f"Batch {batch_id} finished with status={status}, output_file_id={output_file_id}")
+            return items
+
+        r = s.get(f"{BATCH_API_BASE}/files/{output_file_id}/content", timeout=300)
+        r.raise_for_status()
+        output = r.content
+
+    applied = 0
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        record = orjson.loads(line)
+        custom_id = record.get("custom_id")
+        data = items.get(custom_id)
+        if data is None:
+            continue
+
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            logger.warning(f"Batch result for {custom_id} failed: {record.get('error') or response.get('status_code')}")
+            continue
+
+        choices = (response.get("body") or {}).get("choices") or []
+        if not choices:
+            logger.warning(f"Batch result for {custom_id} has no choices")
+            continue
+        content = (choices[0].get("message") or {}).get("content", "")
+        # Parse into a copy: a reply that fails halfway must not leave defaults or partial fields behind
+        work = copy.deepcopy(data)
+        _ensure_lists_in_data(work, DEBTOR_KEYS)
+        _ensure_flag_defaults(work)
+        try:
+            _apply_all_content(work, content)
+            data.clear()
+            data.update(work)
+            applied += 1
+            if applied_ids is not None:
+                applied_ids.add(custom_id)
+        except Exception as e:
+            logger.warning(f"Could not parse batch result for {custom_id}: {e}")
+
+    logger.info(f"Batch {batch_id}: applied {applied}/{len(items)} results")
+    return items
+
+
+def merge_into_output(lots: list, applied_ids: Set[str]) -> list:
+    """
+    Lots already in OUTPUT_FILE (e.g. written by enrich_lot_details) are kept; a lot there is
+    replaced, or a new one appended, only if the batch produced a result for it. Lots without
+    a result stay out, so enrich_lot_details still picks them up. One lot per url, the last
+    copy in the output wins.
+    """
+    existing = load_json(OUTPUT_FILE).get("items", []) if os.path.exists(OUTPUT_FILE) else []
+    by_url: Dict[str, Dict[str, Any]] = {lot["url"]: lot for lot in existing if lot.get("url")}
+    for lot in lots:
+        url = lot.get("url")
+        if url and url in applied_ids:
+            by_url[url] = lot
+    return list(by_url.values())
+
+
+def main(argv: list[str]):
+    """submit: send all non-empty announcements from INPUT_FILE; collect <id>: merge results into OUTPUT_FILE."""
+    if not argv or argv[0] not in ("submit", "collect"):
+        print(__doc__)
+        return
+
+    lots = load_json(INPUT_FILE).get("items", [])
+    # Lot url is the custom_id; empty announcements aren't worth a request
+    by_url = {
+        lot["url"]: lot.setdefault("data", {})
+        for lot in lots
+        if lot.get("url") and (lot.get("data", {}).get("announcement_text") or "").strip()
+    }
+
+    if argv[0] == "submit":
+        batch_id = submit_batch(by_url)
+        os.makedirs(os.path.dirname(BATCH_ID_FILE), exist_ok=True)
+        with open(BATCH_ID_FILE, "w", encoding="utf-8") as f:
+            f.write(batch_id)
+        print(batch_id)
+        return
+
+    if len(argv) > 1:
+        batch_id = argv[1]
+    else:
+        with open(BATCH_ID_FILE, "r", encoding="utf-8") as f:
+            batch_id = f.read().strip()
+    applied_ids: Set[str] = set()
+    collect_batch(batch_id, by_url, applied_ids=applied_ids)
+    merged = merge_into_output(lots, applied_ids)
+    save_json({"count": len(merged), "items": merged}, OUTPUT_FILE, fsync=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,14 +1,63 @@
-import json
+import asyncio
+import hashlib
 import os
 import re
-from typing import Any, Dict, List, Union
+from typing import Any, Callable, Dict, List, Optional, Union
 
+import httpx
+import orjson
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 # OPENROUTER_MODEL = "x-ai/grok-4-fast"
 OPENROUTER_MODEL = "google/gemini-2.5-flash-lite-preview-09-2025"
+REQUEST_TIMEOUT_SECS = 60
+# Сколько запросов к OpenRouter держим в полёте в run_many
+DEFAULT_CONCURRENCY = 32
+# Кэш ответов модели: sha256(модель + prompt) -> content. Prompt содержит текст объявления,
+# поэтому правка инструкции или смена модели сама инвалидирует старые записи.
+AI_CACHE_ENABLED = True
+AI_CACHE_DIR = os.path.join("cache", "ai_requests")
+SESSION_POOL_SIZE = 64
+
+
+def _make_session() -> requests.Session:
+    """Одна keep-alive сессия на модуль: без нового TCP/TLS-рукопожатия на каждый лот."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=SESSION_POOL_SIZE,
+        pool_maxsize=SESSION_POOL_SIZE,
+        # POST к модели без побочных эффектов, поэтому повторяем и его
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False,
+        ),
+    )
+    session.mount("https://", adapter)
+    # Тело шлём готовыми байтами orjson, а не через json=: stdlib-кодировщик в requests
+    # экранирует кириллицу в \uXXXX, и русский prompt раздувается примерно в 2.5 раза
+    session.headers["Content-Type"] = "application/json"
+    return session
+
+
+_SESSION = _make_session()
+
+# .env читаем один раз при импорте, а не на каждый запрос
+load_dotenv()
+_API_KEY = os.getenv("OPENROUTER_APIKEY")
+
+
+def refresh_api_key() -> None:
+    """Перечитать OPENROUTER_APIKEY (например, после правки .env или окружения в тестах)."""
+    global _API_KEY
+    load_dotenv()
+    _API_KEY = os.getenv("OPENROUTER_APIKEY")
 """
 The `ai_request.py` module provides a single entrypoint function `update_debtor_data(data)` that takes a Python dictionary with at least the key `"announcement_text"` and enriches it by calling the OpenRouter API (Gemini 2.5 flash-lite) to extract structured debtor information. It automatically loads your `OPENROUTER_APIKEY` from `.env`, sends the text to the model, and parses the JSON response into consistent arrays: `debtor_name`, `debtor_inn`, `debtor_ogrn`, `case_number`, and `nominal_debt` (floats). The function gracefully handles malformed responses, ensures those keys always exist as lists, and appends any extracted values into them.
 
@@ -23,8 +72,23 @@ print(result)
 ```
 This will return the same dict, augmented with parsed debtor details.
 
+For many lots, `update_debtor_data_batch(items, batch_size=10)` packs up to `batch_size` announcements into one prompt and maps the returned JSON array back onto `items` in order, falling back to per-item calls if the array length does not match.
+
+`run_many(items, concurrency=32, with_flags=False)` enriches a list concurrently over one shared `httpx.AsyncClient`, keeping at most `concurrency` requests in flight (`update_debtor_data_async` / `update_debtor_flags_async` are the per-item coroutines).
+
+`update_debtor_all(data)` fills both the debtor fields and `foreign_debtor_flag` / `individuals` from a single request, instead of `update_debtor_data` followed by `update_debtor_flags`.
+
+Model replies that parse successfully are cached on disk under `cache/ai_requests/`, keyed by sha256 of model + full prompt, so re-running over the same announcements skips the API. Set `AI_CACHE_ENABLED = False` to bypass. In the async path identical prompts that are in flight at the same time share one request.
+
 """
 
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_WS_RE = re.compile(r"\s+")
+_JSON_START_RE = re.compile(r"[{\[]")
+# Строковый литерал (с экранированием; незакрытый — до конца текста) или скобка
+_JSON_SCAN_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"?|[{}\[\]]', re.S)
+
+
 def _first_json_block(text: str) -> str:
     """
     Извлекает первый корректно сбалансированный JSON-блок из произвольной строки.
@@ -35,43 +99,28 @@ def _first_json_block(text: str) -> str:
         return ""
 
     # Срежем кодовые блоки ```...```
-    fence = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
-    text = fence.sub("", text.strip())
+    text = _FENCE_RE.sub("", text.strip())
 
     # Найти первый символ { или [
-    start_idx = None
-    for i, ch in enumerate(text):
-        if ch in "{[":
-            start_idx = i
-            break
-    if start_idx is None:
+    m = _JSON_START_RE.search(text)
+    if m is None:
         return text.strip()
+    start_idx = m.start()
 
     opening = text[start_idx]
     closing = "}" if opening == "{" else "]"
 
+    # Обходим только скобки и строковые литералы целиком: обычные символы
+    # пропускает regex-движок, а не цикл на Python
     depth = 0
-    in_string = False
-    escape = False
-
-    for j in range(start_idx, len(text)):
-        ch = text[j]
-        if in_string:
-            if escape:
-                escape = False
-            elif ch == "\\":
-                escape = True
-            elif ch == '"':
-                in_string = False
-        else:
-            if ch == '"':
-                in_string = True
-            elif ch == opening:
-                depth += 1
-            elif ch == closing:
-                depth -= 1
-                if depth == 0:
-                    return text[start_idx : j + 1].strip()
+    for tok in _JSON_SCAN_RE.finditer(text, start_idx):
+        ch = text[tok.start()]
+        if ch == opening:
+            depth += 1
+        elif ch == closing:
+            depth -= 1
+            if depth == 0:
+                return text[start_idx : tok.end()].strip()
 
     # Если не удалось корректно сбалансировать — вернём хвост как есть
     return text[start_idx:].strip()
@@ -103,15 +152,22 @@ def _extend_field(data: Dict[str, Any], key: str, vals: Union[List[Any], Any]) -
             data[key].append(vals)
 
 
+# NBSP и пробелы убираем, запятую меняем на точку
+_NUM_TRANS = str.maketrans({"\xa0": None, " ": None, ",": "."})
+
+
 def _as_float_list(vals: Union[List[Any], Any]) -> List[float]:
     """Пытается привести значения к списку float, пропуская непереводимые элементы."""
     out: List[float] = []
     for v in _to_list(vals):
+        # Числа (обычный случай: модель вернула float) — без лишних проверок
+        if isinstance(v, (int, float)):
+            out.append(float(v))
+            continue
         try:
-            # Разделители тысяч/пробелы/непробельные символы типа NBSP чистим грубо
+            # Разделители тысяч/пробелы/непробельные символы типа NBSP чистим грубо, за один проход
             if isinstance(v, str):
-                cleaned = v.replace("\xa0", " ").replace(" ", "").replace(",", ".")
-                out.append(float(cleaned))
+                out.append(float(v.translate(_NUM_TRANS)))
             else:
                 out.append(float(v))
         except Exception:
@@ -120,27 +176,11 @@ def _as_float_list(vals: Union[List[Any], Any]) -> List[float]:
     return out
 
 
-def update_debtor_data(data: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Делает запрос к OpenRouter, парсит JSON-ответ и добавляет найденные поля в data.
-    Всегда возвращает массивы:
-      - debtor_name (List[str])
-      - debtor_inn (List[str])
-      - debtor_ogrn (List[str])
-      - case_number (List[str])
-      - nominal_debt (List[float])
-    """
-    load_dotenv()
-    api_key = os.getenv("OPENROUTER_APIKEY")
-    if not api_key:
-        print("Ошибка: переменная окружения OPENROUTER_APIKEY не установлена.")
-        # Гарантируем наличие ключей
-        _ensure_lists_in_data(data, ["debtor_name", "debtor_inn", "debtor_ogrn", "case_number", "nominal_debt"])
-        return data
-
-    text = data.get("announcement_text", "") or ""
+DEBTOR_KEYS = ["debtor_name", "debtor_inn", "debtor_ogrn", "case_number", "nominal_debt"]
+_TEXT_KEYS = ("debtor_name", "debtor_inn", "debtor_ogrn", "case_number")
 
-    prompt = f"""Ты — эксперт по автоматическому извлечению данных (information extraction) из текстов о задолженностях. 
+# Инструкция и примеры — общие для одиночного и пакетного запроса
+_EXTRACT_INSTRUCTIONS = """Ты — эксперт по автоматическому извлечению данных (information extraction) из текстов о задолженностях. 
 Твоя задача — извлечь сведения о должниках и вернуть их в строго структурированном JSON.
 
 **Инструкция:**
@@ -162,13 +202,13 @@ def update_debtor_data(data: Dict[str, Any]) -> Dict[str, Any]:
 
 *Результат:*  
 ```json
-{{
+{
 "debtor_name": ["ООО «Белоярский центр генеральных подрядов"],
 "debtor_inn": ["6670292134"],
 "debtor_ogrn": [],
 "case_number": [],
 "nominal_debt": [1367775154.22]
-}}
+}
 ```
 
 **Пример 2:**
@@ -178,13 +218,13 @@ def update_debtor_data(data: Dict[str, Any]) -> Dict[str, Any]:
 *Результат:*
 
 ```json
-{{
+{
 "debtor_name": ["ООО «МАКСМАРКЕТ»"],
 "debtor_inn": ["5032257375"],
 "debtor_ogrn": [],
 "case_number": ["А41-42654/2024", "А41-73860/2024"],
 "nominal_debt": [3899283.0, 73298.0, 4248940.02]
-}}
+}
 ```
 
 **Пример 3:**
@@ -195,13 +235,13 @@ def update_debtor_data(data: Dict[str, Any]) -> Dict[str, Any]:
 *Результат:*
 
 ```json
-{{
+{
 "debtor_name": ["АО «ВЕКТОРТРЕЙД»", "ООО «Маренго»"],
 "debtor_inn": [],
 "debtor_ogrn": [],
 "case_number": ["А40-113129/2022", "А40-239608/2020"],
 "nominal_debt": []
-}}
+}
 ```
 
 **Пример 4:**
@@ -211,141 +251,261 @@ def update_debtor_data(data: Dict[str, Any]) -> Dict[str, Any]:
 *Результат:*
 
 ```json
-{{
+{
 "debtor_name": ["Администрации Пролетарского городского поселения"],
 "debtor_inn": ["5310017050"],
 "debtor_ogrn": ["1115321002972"],
 "case_number": [],
 "nominal_debt": [84080.03]
-}}
-```
+}
+```"""
 
-**Теперь выполни задачу для следующего текста:**
 
-*Текст:*
-{text}
+def _cache_path(prompt: str) -> str:
+    digest = hashlib.sha256(f"{OPENROUTER_MODEL}\n{prompt}".encode("utf-8")).hexdigest()
+    return os.path.join(AI_CACHE_DIR, digest[:2], f"{digest}.json")
 
-*Результат:*
 
-```json
-    """
-    # prompt = data.get("_prompt_override") or f"[PROMPT_OMITTED_FOR_BREVITY]\n\n{text}"
+def _cache_get(prompt: str) -> Optional[str]:
+    """Ответ модели на этот prompt из кэша, если он там есть."""
+    if not AI_CACHE_ENABLED:
+        return None
+    try:
+        with open(_cache_path(prompt), "rb") as f:
+            return orjson.loads(f.read()).get("content")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _cache_put(prompt: str, content: str) -> None:
+    """Сохраняет ответ, который успешно разобрался. Ошибки записи не фатальны."""
+    if not AI_CACHE_ENABLED or not content:
+        return
+    path = _cache_path(prompt)
+    if os.path.exists(path):
+        return
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps({"model": OPENROUTER_MODEL, "content": content}))
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Не удалось сохранить ответ в кэш {path}: {e}")
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
+
+def _post_prompt(api_key: str, prompt: str) -> str:
+    """Отправляет prompt в OpenRouter и возвращает текст ответа модели (сначала смотрит в кэш)."""
+    cached = _cache_get(prompt)
+    if cached is not None:
+        return cached
 
     payload = {
         "model": OPENROUTER_MODEL,
         "messages": [{"role": "user", "content": prompt}],
     }
 
-    # Гарантируем нужные ключи как списки заранее
-    target_keys = ["debtor_name", "debtor_inn", "debtor_ogrn", "case_number", "nominal_debt"]
-    _ensure_lists_in_data(data, target_keys)
-
+    resp = _SESSION.post(
+        OPENROUTER_API_URL,
+        headers={"Authorization": f"Bearer {api_key}"},
+        data=orjson.dumps(payload),
+        timeout=REQUEST_TIMEOUT_SECS,
+    )
+    resp.raise_for_status()
+    response_json = orjson.loads(resp.content)
+    return (
+        response_json.get("choices", [{}])[0]
+        .get("message", {})
+        .get("content", "")
+    )
+
+
+def _ask(api_key: str, prompt: str, data: Dict[str, Any], apply: Callable[[Dict[str, Any], str], None]) -> None:
+    """Запрос, разбор ответа через apply и запись в кэш. Ошибки печатаются, data остаётся как есть."""
     try:
-        resp = requests.post(OPENROUTER_API_URL, headers=headers, data=json.dumps(payload), timeout=60)
-        resp.raise_for_status()
-        response_json = resp.json()
-        content = (
-            response_json.get("choices", [{}])[0]
-            .get("message", {})
-            .get("content", "")
-        )
-        cleaned = _first_json_block(content)
-        if not cleaned:
-            return data
-
-        # Иногда модель склеивает несколько объектов без [] — попробуем мягко обернуть
-        # Но сначала обычная попытка распарсить как есть
-        try:
-            parsed = json.loads(cleaned)
-        except json.JSONDecodeError:
-            # Хак: удалить переводы строк/лишние пробелы между },{ и попробовать обернуть в []
-            glued = re.sub(r"\s+", " ", cleaned).strip()
-            if "}," in glued and "{" in glued and not glued.strip().startswith("["):
-                try:
-                    parsed = json.loads(f"[{glued}]")
-                except Exception:
-                    raise
-            else:
-                raise
-
-        # Теперь нормализуем и переносим значения в data
-        def absorb(obj: Dict[str, Any]) -> None:
-            # Каждое поле может быть скаляром или списком
-            # nominal_debt приводим к float
-            if "debtor_name" in obj:
-                _extend_field(data, "debtor_name", _to_list(obj.get("debtor_name")))
-            if "debtor_inn" in obj:
-                _extend_field(data, "debtor_inn", _to_list(obj.get("debtor_inn")))
-            if "debtor_ogrn" in obj:
-                _extend_field(data, "debtor_ogrn", _to_list(obj.get("debtor_ogrn")))
-            if "case_number" in obj:
-                _extend_field(data, "case_number", _to_list(obj.get("case_number")))
-            if "nominal_debt" in obj:
-                data["nominal_debt"].extend(_as_float_list(obj.get("nominal_debt")))
-
-        if isinstance(parsed, dict):
-            # Вариант: один объект сразу со списками
-            absorb(parsed)
-        elif isinstance(parsed, list):
-            # Вариант: список объектов / список словарей
-            for elem in parsed:
-                if isinstance(elem, dict):
-                    absorb(elem)
-                elif isinstance(elem, list):
-                    # иногда может быть вложенный список — попробуем разобрать словари внутри
-                    for sub in elem:
-                        if isinstance(sub, dict):
-                            absorb(sub)
-        else:
-            # Ничего полезного
-            pass
-
+        content = _post_prompt(api_key, prompt)
+        apply(data, content)
+        _cache_put(prompt, content)
     except requests.RequestException as e:
         print(f"Ошибка запроса к API: {e}")
-    except json.JSONDecodeError:
-        print(f"Ошибка: не удалось распознать JSON в ответе: {cleaned if 'cleaned' in locals() else '<<empty>>'}")
+    except orjson.JSONDecodeError as e:
+        print(f"Ошибка: не удалось распознать JSON в ответе: {e.doc or '<<empty>>'}")
     except Exception as e:
         print(f"Непредвиденная ошибка при обработке ответа: {e}")
 
-    return data
 
+def _parse_debtor_json(cleaned: str) -> Any:
+    """orjson.loads с мягкой починкой склеенных объектов без []."""
+    # Иногда модель склеивает несколько объектов без [] — попробуем мягко обернуть
+    # Но сначала обычная попытка распарсить как есть
+    try:
+        return orjson.loads(cleaned)
+    except orjson.JSONDecodeError:
+        # Хак: удалить переводы строк/лишние пробелы между },{ и попробовать обернуть в []
+        glued = _WS_RE.sub(" ", cleaned).strip()
+        if "}," in glued and "{" in glued and not glued.strip().startswith("["):
+            return orjson.loads(f"[{glued}]")
+        raise
+
+
+def _absorb(data: Dict[str, Any], obj: Dict[str, Any]) -> None:
+    """Переносит поля одного объекта ответа в data."""
+    # Берём из ответа только нужные ключи, по одному обращению на ключ;
+    # всё прочее, что модель могла добавить, не трогаем.
+    # Каждое поле может быть скаляром или списком
+    for key in _TEXT_KEYS:
+        vals = obj.get(key)
+        if vals is not None:
+            _extend_field(data, key, _to_list(vals))
+    # nominal_debt приводим к float
+    debts = obj.get("nominal_debt")
+    if debts is not None:
+        data["nominal_debt"].extend(_as_float_list(debts))
+
+
+def _absorb_parsed(data: Dict[str, Any], parsed: Any) -> None:
+    """Переносит в data распарсенный ответ: объект или список объектов."""
+    if isinstance(parsed, dict):
+        # Вариант: один объект сразу со списками
+        _absorb(data, parsed)
+    elif isinstance(parsed, list):
+        # Вариант: список объектов / список словарей
+        for elem in parsed:
+            if isinstance(elem, dict):
+                _absorb(data, elem)
+            elif isinstance(elem, list):
+                # иногда может быть вложенный список — попробуем разобрать словари внутри
+                for sub in elem:
+                    if isinstance(sub, dict):
+                        _absorb(data, sub)
+
+
+_EXTRACT_PROMPT_PREFIX = _EXTRACT_INSTRUCTIONS + """
 
-def update_debtor_flags(data: dict) -> dict:
-    """
-    Sends a separate AI request to classify:
-      - foreign_debtor_flag: 0 (no foreign), 1 (mixed), or "иностранная" (all foreign)
-      - individuals: "физлицо" if exclusively individuals, else ""
+**Теперь выполни задачу для следующего текста:**
 
-    Input:
-      data: {
-        "announcement_text": str,
-        ...
-      }
+*Текст:*
+"""
+_EXTRACT_PROMPT_SUFFIX = """
 
-    Output (mutates and returns data):
-      data["foreign_debtor_flag"] in {0, 1, "иностранная"}
-      data["individuals"] in {"физлицо", ""}
+*Результат:*
+
+```json
     """
-    # Ensure defaults
-    if "foreign_debtor_flag" not in data:
-        data["foreign_debtor_flag"] = 0
-    if "individuals" not in data:
-        data["individuals"] = ""
 
-    load_dotenv()
-    api_key = os.getenv("OPENROUTER_APIKEY")
+
+def _extract_prompt(text: str) -> str:
+    """Prompt извлечения полей должника для одного объявления."""
+    # Меняется только текст — статичные части склеиваем, а не собираем f-строкой заново
+    return _EXTRACT_PROMPT_PREFIX + text + _EXTRACT_PROMPT_SUFFIX
+
+
+def _apply_debtor_content(data: Dict[str, Any], content: str) -> None:
+    """Разбирает ответ модели и переносит найденные поля в data."""
+    cleaned = _first_json_block(content)
+    if not cleaned:
+        return
+    # Теперь нормализуем и переносим значения в data
+    _absorb_parsed(data, _parse_debtor_json(cleaned))
+
+
+def update_debtor_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Делает запрос к OpenRouter, парсит JSON-ответ и добавляет найденные поля в data.
+    Всегда возвращает массивы:
+      - debtor_name (List[str])
+      - debtor_inn (List[str])
+      - debtor_ogrn (List[str])
+      - case_number (List[str])
+      - nominal_debt (List[float])
+    """
+    api_key = _API_KEY
+    # Гарантируем нужные ключи как списки заранее
+    _ensure_lists_in_data(data, DEBTOR_KEYS)
     if not api_key:
         print("Ошибка: переменная окружения OPENROUTER_APIKEY не установлена.")
         return data
 
-    text = (data.get("announcement_text") or "").strip()
+    text = data.get("announcement_text", "") or ""
+    prompt = _extract_prompt(text)
+    # prompt = data.get("_prompt_override") or f"[PROMPT_OMITTED_FOR_BREVITY]\n\n{text}"
+
+    _ask(api_key, prompt, data, _apply_debtor_content)
+
+    return data
+
+
+def _batch_extract_prompt(texts: List[str]) -> str:
+    """Один prompt на несколько текстов: ответ — JSON-массив, по объекту на текст."""
+    n = len(texts)
+    parts = [
+        _EXTRACT_INSTRUCTIONS,
+        "",
+        f"**Теперь выполни задачу для каждого из {n} текстов ниже.**",
+        f"Ответ — JSON-массив ровно из {n} объектов, по одному на каждый текст, в том же порядке: "
+        "[{...}, {...}, ...]. Если в тексте ничего не найдено, верни для него объект с пустыми массивами.",
+        "",
+    ]
+    for i, text in enumerate(texts, 1):
+        parts += [f"### Item {i}", text, ""]
+    parts += ["*Результат:*", "", "```json"]
+    return "\n".join(parts)
+
+
+def update_debtor_data_batch(items: List[Dict[str, Any]], batch_size: int = 10) -> List[Dict[str, Any]]:
+    """
+    То же, что update_debtor_data, но до batch_size объявлений уходят одним запросом
+    (N/batch_size вызовов вместо N). Если модель вернула массив не той длины или ответ
+    не разобрался — пачка обрабатывается поштучно через update_debtor_data.
+    Мутирует и возвращает items.
+    """
+    api_key = _API_KEY
+    for data in items:
+        _ensure_lists_in_data(data, DEBTOR_KEYS)
+    if not api_key:
+        print("Ошибка: переменная окружения OPENROUTER_APIKEY не установлена.")
+        return items
+
+    # Пустые объявления в запрос не отправляем
+    todo = [d for d in items if (d.get("announcement_text") or "").strip()]
+    batch_size = max(1, batch_size)
+
+    for start in range(0, len(todo), batch_size):
+        chunk = todo[start : start + batch_size]
+        if len(chunk) == 1:
+            update_debtor_data(chunk[0])
+            continue
+
+        parsed = None
+        cleaned = ""
+        prompt = _batch_extract_prompt([d["announcement_text"] for d in chunk])
+        try:
+            content = _post_prompt(api_key, prompt)
+            cleaned = _first_json_block(content)
+            if cleaned:
+                parsed = _parse_debtor_json(cleaned)
+        except requests.RequestException as e:
+            print(f"Ошибка запроса к API: {e}")
+        except orjson.JSONDecodeError:
+            print(f"Ошибка: не удалось распознать JSON в пакетном ответе: {cleaned or '<<empty>>'}")
+        except Exception as e:
+            print(f"Непредвиденная ошибка при обработке пакетного ответа: {e}")
+
+        if not isinstance(parsed, list) or len(parsed) != len(chunk):
+            got = len(parsed) if isinstance(parsed, list) else type(parsed).__name__
+            print(f"Пакетный ответ: {got} вместо {len(chunk)} объектов — обрабатываю поштучно")
+            for data in chunk:
+                update_debtor_data(data)
+            continue
 
-    prompt = f"""
+        for data, obj in zip(chunk, parsed):
+            _absorb_parsed(data, obj)
+        _cache_put(prompt, content)
+
+    return items
+
+
+_FLAGS_PROMPT_PREFIX = """
 Ты — эксперт по извлечению структурированных признаков из юридических объявлений о дебиторской задолженности.
 Задача: по полному тексту объявления (далее: announcement_text) определить два признака и вернуть СТРОГИЙ JSON без лишнего текста.
 
@@ -371,104 +531,341 @@ def update_debtor_flags(data: dict) -> dict:
 - individuals = "физлицо" только если должники представлены исключительно как физлица; иначе "".
 
 Формат ответа — СТРОГИЙ JSON, без комментариев и без обрамления ```:
-{{
+{
   "foreign_debtor_flag": 0 | 1 | "иностранная",
   "individuals": "физлицо" | ""
-}}
+}
 
 Пример входных-выходных данных:
 announcement_text: 
 Право требования к физическим лицам …
 
 Результат:
-{{
+{
   "foreign_debtor_flag": 0,
   "individuals": "физлицо"
-}}
+}
 
 
 Теперь обработай следующий текст и верни только JSON:
 announcement_text:
-{text}
 """
 
- 
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
+def _flags_prompt(text: str) -> str:
+    """Prompt классификации foreign_debtor_flag / individuals для одного объявления."""
+    return _FLAGS_PROMPT_PREFIX + text + "\n"
+
+
+# Normalize foreign_debtor_flag -> {0, 1, "иностранная"}
+def _norm_foreign(v: Any) -> Union[int, str]:
+    if isinstance(v, str):
+        vs = v.strip().lower()
+        if vs in {"0", "none", "no", "нет", "domestic", "российская", "только российская"}:
+            return 0
+        if vs in {"1", "some", "mixed", "смешанная", "частично", "да"}:
+            return 1
+        if vs in {"иностранная", "иностранный", "all", "foreign", "all_foreign", "только иностранная", "полностью иностранная"}:
+            return "иностранная"
+    if isinstance(v, (int, float)):
+        i = int(v)
+        if i == 0:
+            return 0
+        if i == 1:
+            return 1
+        if i >= 2:  # tolerate 2 meaning "all foreign"
+            return "иностранная"
+    return 0
+
+
+# Normalize individuals -> "физлицо" | ""
+def _norm_individuals(v: Any) -> str:
+    if not isinstance(v, str):
+        return ""
+    vs = v.strip().lower()
+    if vs in {
+        "физлицо", "физ.лицо", "физические лица", "физлица",
+        "граждане", "гражданин", "individual", "natural_persons"
+    }:
+        return "физлицо"
+    return ""
+
+
+def _ensure_flag_defaults(data: Dict[str, Any]) -> None:
+    if "foreign_debtor_flag" not in data:
+        data["foreign_debtor_flag"] = 0
+    if "individuals" not in data:
+        data["individuals"] = ""
 
-    payload = {
-        "model": OPENROUTER_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-    }
+
+def _apply_flags_content(data: Dict[str, Any], content: str) -> None:
+    """Разбирает ответ модели и записывает нормализованные флаги в data."""
+    cleaned = _first_json_block(content)
+    if not cleaned:
+        return
 
     try:
-        resp = requests.post(OPENROUTER_API_URL, headers=headers, data=json.dumps(payload), timeout=60)
-        resp.raise_for_status()
-        response_json = resp.json()
-        content = (
-            response_json.get("choices", [{}])[0]
-            .get("message", {})
-            .get("content", "")
+        parsed = orjson.loads(cleaned)
+    except orjson.JSONDecodeError:
+        glued = _WS_RE.sub(" ", cleaned).strip()
+        parsed = orjson.loads(glued)  # last-ditch attempt
+
+    if not isinstance(parsed, dict):
+        return
+
+    raw_foreign = parsed.get("foreign_debtor_flag", data["foreign_debtor_flag"])
+    raw_indiv = parsed.get("individuals", data["individuals"])
+
+    data["foreign_debtor_flag"] = _norm_foreign(raw_foreign)
+    data["individuals"] = _norm_individuals(raw_indiv)
+
+
+def update_debtor_flags(data: dict) -> dict:
+    """
+    Sends a separate AI request to classify:
+      - foreign_debtor_flag: 0 (no foreign), 1 (mixed), or "иностранная" (all foreign)
+      - individuals: "физлицо" if exclusively individuals, else ""
+
+    Input:
+      data: {
+        "announcement_text": str,
+        ...
+      }
+
+    Output (mutates and returns data):
+      data["foreign_debtor_flag"] in {0, 1, "иностранная"}
+      data["individuals"] in {"физлицо", ""}
+    """
+    # Ensure defaults
+    _ensure_flag_defaults(data)
+
+    api_key = _API_KEY
+    if not api_key:
+        print("Ошибка: переменная окружения OPENROUTER_APIKEY не установлена.")
+        return data
+
+    text = (data.get("announcement_text") or "").strip()
+
+    _ask(api_key, _flags_prompt(text), data, _apply_flags_content)
+
+    return data
+
+
+# --- Один запрос вместо двух: поля должника и флаги вместе ---
+
+_ALL_PROMPT_PREFIX = _EXTRACT_INSTRUCTIONS + """
+
+**Дополнительно** определи по тому же тексту два признака:
+- foreign_debtor_flag:
+  • 0 — если среди должников нет иностранных;
+  • 1 — если есть смешение: часть должников иностранные, часть — российские;
+  • "иностранная" — если все должники иностранные.
+  Симптомы иностранных компаний (но всякое бывает!): название латиницей (Vellia Corporation, Atena OOO),
+  адрес за рубежом ("Соединенные Штаты Америки, 19808, Делавэр..."), сумма в иностранной валюте (CNY и т.п.).
+- individuals:
+  • "физлицо" — если должники представлены ИСКЛЮЧИТЕЛЬНО как физические лица (население, граждане, люди), без упоминаний организаций;
+  • "" — во всех остальных случаях (включая смешанные списки, компании и т.п.).
+
+Ответ — ОДИН JSON-объект со всеми полями сразу:
+{
+"debtor_name": [...],
+"debtor_inn": [...],
+"debtor_ogrn": [...],
+"case_number": [...],
+"nominal_debt": [...],
+"foreign_debtor_flag": 0 | 1 | "иностранная",
+"individuals": "физлицо" | ""
+}
+
+**Теперь выполни задачу для следующего текста:**
+
+*Текст:*
+"""
+
+
+def _all_prompt(text: str) -> str:
+    """Совмещённый prompt: поля должника + foreign_debtor_flag / individuals."""
+    return _ALL_PROMPT_PREFIX + text + _EXTRACT_PROMPT_SUFFIX
+
+
+def _apply_all_content(data: Dict[str, Any], content: str) -> None:
+    """Разбирает совмещённый ответ: поля должника как в update_debtor_data, флаги как в update_debtor_flags."""
+    cleaned = _first_json_block(content)
+    if not cleaned:
+        return
+    parsed = _parse_debtor_json(cleaned)
+    _absorb_parsed(data, parsed)
+
+    # Флаги берём из объекта; если модель вернула список — из первого объекта, где они есть
+    flags: Any = parsed
+    if isinstance(parsed, list):
+        flags = next(
+            (e for e in parsed if isinstance(e, dict) and ("foreign_debtor_flag" in e or "individuals" in e)),
+            None,
         )
-        cleaned = _first_json_block(content)
-        if not cleaned:
-            return data
+    if not isinstance(flags, dict):
+        return
+
+    data["foreign_debtor_flag"] = _norm_foreign(flags.get("foreign_debtor_flag", data["foreign_debtor_flag"]))
+    data["individuals"] = _norm_individuals(flags.get("individuals", data["individuals"]))
 
-        try:
-            parsed = json.loads(cleaned)
-        except json.JSONDecodeError:
-            glued = re.sub(r"\s+", " ", cleaned).strip()
-            parsed = json.loads(glued)  # last-ditch attempt
 
-        if not isinstance(parsed, dict):
-            return data
+def update_debtor_all(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    update_debtor_data + update_debtor_flags одним запросом к модели: текст объявления
+    отправляется (и оплачивается) один раз. Результат в data тот же, что после двух вызовов.
+    """
+    _ensure_lists_in_data(data, DEBTOR_KEYS)
+    _ensure_flag_defaults(data)
 
-        raw_foreign = parsed.get("foreign_debtor_flag", data["foreign_debtor_flag"])
-        raw_indiv = parsed.get("individuals", data["individuals"])
+    api_key = _API_KEY
+    if not api_key:
+        print("Ошибка: переменная окружения OPENROUTER_APIKEY не установлена.")
+        return data
 
-        # Normalize foreign_debtor_flag -> {0, 1, "иностранная"}
-        def norm_foreign(v):
-            if isinstance(v, str):
-                vs = v.strip().lower()
-                if vs in {"0", "none", "no", "нет", "domestic", "российская", "только российская"}:
-                    return 0
-                if vs in {"1", "some", "mixed", "смешанная", "частично", "да"}:
-                    return 1
-                if vs in {"иностранная", "иностранный", "all", "foreign", "all_foreign", "только иностранная", "полностью иностранная"}:
-                    return "иностранная"
-            if isinstance(v, (int, float)):
-                i = int(v)
-                if i == 0:
-                    return 0
-                if i == 1:
-                    return 1
-                if i >= 2:  # tolerate 2 meaning "all foreign"
-                    return "иностранная"
-            return 0
+    text = data.get("announcement_text", "") or ""
+    _ask(api_key, _all_prompt(text), data, _apply_all_content)
+    return data
 
-        # Normalize individuals -> "физлицо" | ""
-        def norm_individuals(v):
-            if not isinstance(v, str):
-                return ""
-            vs = v.strip().lower()
-            if vs in {
-                "физлицо", "физ.лицо", "физические лица", "физлица",
-                "граждане", "гражданин", "individual", "natural_persons"
-            }:
-                return "физлицо"
-            return ""
-
-        data["foreign_debtor_flag"] = norm_foreign(raw_foreign)
-        data["individuals"] = norm_individuals(raw_indiv)
 
-    except requests.RequestException as e:
+# --- Асинхронный режим: много объявлений параллельно через один httpx.AsyncClient ---
+
+# Запросы в полёте: одинаковые объявления из одной пачки ждут один ответ, а не шлют копии
+# (в дисковый кэш ответ попадает только после разбора, поэтому параллельные дубли его не видят).
+# Запись снимает _ask_async, когда ответ уже разобран и записан в кэш.
+_INFLIGHT: Dict[str, "asyncio.Future[str]"] = {}
+
+
+async def _post_prompt_async(client: httpx.AsyncClient, api_key: str, prompt: str) -> str:
+    """Асинхронный вариант _post_prompt на общем клиенте (keep-alive между вызовами)."""
+    cached = _cache_get(prompt)
+    if cached is not None:
+        return cached
+
+    future = _INFLIGHT.get(prompt)
+    if future is None:
+        future = asyncio.ensure_future(_fetch_prompt_async(client, api_key, prompt))
+        _INFLIGHT[prompt] = future
+    # shield: отмена одного ожидающего не отменяет запрос для остальных
+    return await asyncio.shield(future)
+
+
+async def _fetch_prompt_async(client: httpx.AsyncClient, api_key: str, prompt: str) -> str:
+    resp = await client.post(
+        OPENROUTER_API_URL,
+        headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        content=orjson.dumps({
+            "model": OPENROUTER_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+        }),
+    )
+    resp.raise_for_status()
+    response_json = orjson.loads(resp.content)
+    return (
+        response_json.get("choices", [{}])[0]
+        .get("message", {})
+        .get("content", "")
+    )
+
+
+async def _ask_async(
+    client: httpx.AsyncClient,
+    api_key: str,
+    prompt: str,
+    data: Dict[str, Any],
+    apply: Callable[[Dict[str, Any], str], None],
+) -> None:
+    """Асинхронный _ask."""
+    try:
+        content = await _post_prompt_async(client, api_key, prompt)
+        apply(data, content)
+        _cache_put(prompt, content)
+    except httpx.HTTPError as e:
         print(f"Ошибка запроса к API: {e}")
-    except json.JSONDecodeError:
-        print(f"Ошибка: не удалось распознать JSON в ответе: {cleaned if 'cleaned' in locals() else '<<empty>>'}")
+    except orjson.JSONDecodeError as e:
+        print(f"Ошибка: не удалось распознать JSON в ответе: {e.doc or '<<empty>>'}")
     except Exception as e:
         print(f"Непредвиденная ошибка при обработке ответа: {e}")
+    finally:
+        _INFLIGHT.pop(prompt, None)
+
+
+async def update_debtor_data_async(data: Dict[str, Any], client: httpx.AsyncClient) -> Dict[str, Any]:
+    """Асинхронный update_debtor_data: тот же prompt и разбор, запрос через client."""
+    api_key = _API_KEY
+    _ensure_lists_in_data(data, DEBTOR_KEYS)
+    if not api_key:
+        print("Ошибка: переменная окружения OPENROUTER_APIKEY не установлена.")
+        return data
+
+    text = data.get("announcement_text", "") or ""
+    await _ask_async(client, api_key, _extract_prompt(text), data, _apply_debtor_content)
+
+    return data
+
+
+async def update_debtor_flags_async(data: Dict[str, Any], client: httpx.AsyncClient) -> Dict[str, Any]:
+    """Асинхронный update_debtor_flags: тот же prompt и нормализация, запрос через client."""
+    _ensure_flag_defaults(data)
+
+    api_key = _API_KEY
+    if not api_key:
+        print("Ошибка: переменная окружения OPENROUTER_APIKEY не установлена.")
+        return data
+
+    text = (data.get("announcement_text") or "").strip()
+    await _ask_async(client, api_key, _flags_prompt(text), data, _apply_flags_content)
 
     return data
+
+
+async def update_debtor_all_async(data: Dict[str, Any], client: httpx.AsyncClient) -> Dict[str, Any]:
+    """Асинхронный update_debtor_all: поля должника и флаги одним запросом."""
+    _ensure_lists_in_data(data, DEBTOR_KEYS)
+    _ensure_flag_defaults(data)
+
+    api_key = _API_KEY
+    if not api_key:
+        print("Ошибка: переменная окружения OPENROUTER_APIKEY не установлена.")
+        return data
+
+    text = data.get("announcement_text", "") or ""
+    await _ask_async(client, api_key, _all_prompt(text), data, _apply_all_content)
+    return data
+
+
+async def run_many_async(
+    items: List[Dict[str, Any]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    with_flags: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Обогащает items (как update_debtor_data, или update_debtor_all при with_flags=True),
+    держа в полёте не больше concurrency запросов. Воркеры берут объявления из общего
+    итератора, поэтому следующий запрос уходит только когда завершился предыдущий.
+    Мутирует и возвращает items.
+    """
+    concurrency = max(1, min(concurrency, len(items)))
+    pending = iter(items)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT_SECS, limits=limits) as client:
+        async def worker() -> None:
+            for data in pending:
+                if with_flags:
+                    await update_debtor_all_async(data, client)
+                else:
+                    await update_debtor_data_async(data, client)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return items
+
+
+def run_many(
+    items: List[Dict[str, Any]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    with_flags: bool = False,
+) -> List[Dict[str, Any]]:
+    """Синхронная обёртка над run_many_async для вызова из обычного кода."""
+    return asyncio.run(run_many_async(items, concurrency=concurrency, with_flags=with_flags))
@@ -1,11 +1,18 @@
+import asyncio
 import requests
 import logging
+import httpx
+import orjson
+from requests.adapters import HTTPAdapter
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from .config import config
 
 logger = logging.getLogger(__name__)
 
+# Соединений в пуле на хост: хватает для параллельных запросов деталей торгов
+POOL_SIZE = 32
+
 class APIClient:
     """Клиент для взаимодействия с API TBankrot."""
 
@@ -13,20 +20,26 @@ class APIClient:
         self.session = requests.Session()
         self.session.cookies.update(config.cookies)
         self.session.headers.update(config.headers)
+        # Повторы делает make_request, поэтому адаптер только держит пул соединений
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
-    def make_request(self, url: str, json_data: Dict[str, Any], retries: int = 0) -> requests.Response:
-        try:
-            response = self.session.post(url, json=json_data, timeout=30)
-            response.raise_for_status()
-            return response
-        except requests.exceptions.RequestException as e:
-            if retries < config.MAX_RETRIES:
-                logger.warning(f"Запрос не удался, повторяем ({retries + 1}/{config.MAX_RETRIES}): {e}")
-                time.sleep(config.RETRY_DELAY * (retries + 1))
-                return self.make_request(url, json_data, retries + 1)
-            else:
-                logger.error(f"Запрос не удался после {config.MAX_RETRIES} попыток: {e}")
-                raise Exception(f"Запрос не удался: {e}")
+    def make_request(self, url: str, json_data: Dict[str, Any]) -> requests.Response:
+        # Тело сериализуем один раз на все попытки (Content-Type уже в config.headers)
+        body = orjson.dumps(json_data)
+        for attempt in range(config.MAX_RETRIES + 1):
+            try:
+                response = self.session.post(url, data=body, timeout=30)
+                response.raise_for_status()
+                return response
+            except requests.exceptions.RequestException as e:
+                if attempt == config.MAX_RETRIES:
+                    logger.error(f"Запрос не удался после {config.MAX_RETRIES} попыток: {e}")
+                    raise Exception(f"Запрос не удался: {e}")
+                logger.warning(f"Запрос не удался, повторяем ({attempt + 1}/{config.MAX_RETRIES}): {e}")
+                # Экспоненциальная пауза: RETRY_DELAY, 2x, 4x, ...
+                time.sleep(config.RETRY_DELAY * (2 ** attempt))
 
     def fetch_trade_list(self, limit: int = None, offset: int = 0) -> Dict[str, Any]:
         """Получить список торгов из API."""
@@ -37,7 +50,7 @@ class APIClient:
             **config.api_config,
             'limit': limit,
             'offset': offset,
-            'search': config.default_search_params
+            'search': config.get_default_search_params()
         }
 
         url = config.API_URL + config.TRADE_LIST_ENDPOINT
@@ -57,6 +70,59 @@ class APIClient:
         response = self.make_request(url, json_data)
         return response.json()
 
+    async def _make_request_async(self, client: httpx.AsyncClient, url: str, json_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Асинхронный make_request: те же повторы и паузы, ответ сразу в виде dict."""
+        body = orjson.dumps(json_data)
+        for attempt in range(config.MAX_RETRIES + 1):
+            try:
+                response = await client.post(url, content=body)
+                response.raise_for_status()
+                return orjson.loads(response.content)
+            except httpx.HTTPError as e:
+                if attempt == config.MAX_RETRIES:
+                    logger.error(f"Запрос не удался после {config.MAX_RETRIES} попыток: {e}")
+                    raise Exception(f"Запрос не удался: {e}")
+                logger.warning(f"Запрос не удался, повторяем ({attempt + 1}/{config.MAX_RETRIES}): {e}")
+                await asyncio.sleep(config.RETRY_DELAY * (2 ** attempt))
+
+    async def fetch_trade_details_many_async(
+        self, trade_ids: List[str], concurrency: int = POOL_SIZE
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        Детали нескольких торгов параллельно, не больше concurrency запросов в полёте.
+        Результат в том же порядке, что trade_ids; None — если запрос так и не прошёл.
+        """
+        url = config.API_URL + config.TRADE_GET_ENDPOINT
+        results: Dict[int, Optional[Dict[str, Any]]] = {}
+        pending = iter(enumerate(trade_ids))
+        concurrency = max(1, min(concurrency, len(trade_ids)))
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+        # requests молча пропускает None-значения, httpx — нет
+        headers = {k: v for k, v in config.headers.items() if v is not None}
+        cookies = {k: v for k, v in config.cookies.items() if v is not None}
+
+        async with httpx.AsyncClient(headers=headers, cookies=cookies, timeout=30, limits=limits) as client:
+            async def worker() -> None:
+                for i, trade_id in pending:
+                    try:
+                        results[i] = await self._make_request_async(
+                            client, url, {**config.api_config, 'id': trade_id}
+                        )
+                    except Exception as e:
+                        logger.error(f"Не удалось получить торги {trade_id}: {e}")
+                        results[i] = None
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+        return [results[i] for i in range(len(trade_ids))]
+
+    def fetch_trade_details_many(
+        self, trade_ids: List[str], concurrency: int = POOL_SIZE
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Синхронная обёртка над fetch_trade_details_many_async."""
+        return asyncio.run(self.fetch_trade_details_many_async(trade_ids, concurrency))
+
     def validate_auth(self, response_data: Dict[str, Any]) -> bool:
         """Проверить что API ответ указывает на успешную аутентификацию."""
         return response_data.get('userAuth') == True
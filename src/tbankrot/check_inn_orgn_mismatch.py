@@ -1,113 +1,123 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import json
 import os
+import shutil
+from typing import Iterator
 
+import ijson
+import orjson
 from loguru import logger
 
 INPUT_FILE = "debug/lot_details_full_ai.json"
 OUTPUT_FILE = "debug/lot_details_with_inn_ogrn_check.json"
 
-def load_json(path: str):
-    """Load JSON file with error handling."""
-    if not os.path.exists(path):
-        logger.error(f"Input file not found: {path}")
-        return None
-    
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        logger.exception(f"Failed to load {path}: {e}")
-        return None
+def iter_items(path: str) -> Iterator[dict]:
+    """Stream lots from items[*] one by one instead of loading the whole file."""
+    with open(path, "rb") as f:
+        # use_float: nominal_debt etc. as float, not Decimal (orjson can't dump Decimal)
+        yield from ijson.items(f, "items.item", use_float=True)
+
+def write_item(out, lot: dict, first: bool):
+    """Append one lot to the items body, indented as it would be inside {"items": [...]}."""
+    out.write(b"\n    " if first else b",\n    ")
+    dumped = orjson.dumps(lot, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    # JSON strings can't contain raw newlines, so this only shifts the layout
+    out.write(dumped.replace(b"\n", b"\n    "))
 
-def save_json(data, path: str):
-    """Save JSON to file."""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
+def save_streamed(path: str, count: int, body_path: str):
+    """
+    Wrap the streamed items body into the final {"count", "items"} file.
+    Only count and items are written: other top-level keys of the input are not carried
+    over (enrich_lot_details and ai_batch, which produce it, write no others).
+    """
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with open(path, "wb") as f:
+            f.write(b'{\n  "count": %d,\n  "items": [' % count)
+            with open(body_path, "rb") as body:
+                shutil.copyfileobj(body, f)
+            f.write(b"\n  ]\n}")
         logger.info(f"Saved to {path}")
     except Exception as e:
         logger.exception(f"Failed to save {path}: {e}")
+    finally:
+        if os.path.exists(body_path):
+            os.remove(body_path)
 
 def check_inn_orgn_mismatch(lot_data: dict) -> bool:
     """Check if debtor_inn is empty but debtor_ogrn is not empty."""
-    debtor_inn = lot_data.get("debtor_inn", [])
-    debtor_ogrn = lot_data.get("debtor_ogrn", [])
-    
-    # Check if debtor_inn is empty (empty list or missing)
-    inn_empty = not debtor_inn or len(debtor_inn) == 0
-    
-    # Check if debtor_ogrn is not empty
-    ogrn_not_empty = bool(debtor_ogrn) and len(debtor_ogrn) > 0
-    
-    return inn_empty and ogrn_not_empty
+    return check_lot(lot_data)[0]
 
 def check_empty_individuals_no_inn_orgn(lot_data: dict) -> bool:
     """Check if individuals is empty string but both debtor_inn and debtor_ogrn are empty."""
-    individuals = lot_data.get("individuals", "")
-    debtor_inn = lot_data.get("debtor_inn", [])
-    debtor_ogrn = lot_data.get("debtor_ogrn", [])
-    
-    # Check if individuals is empty string
-    individuals_empty = individuals == ""
-    
-    # Check if both debtor_inn and debtor_ogrn are empty
-    inn_empty = not debtor_inn or len(debtor_inn) == 0
-    ogrn_empty = not debtor_ogrn or len(debtor_ogrn) == 0
-    
-    return individuals_empty and inn_empty and ogrn_empty
+    return check_lot(lot_data)[1]
+
+def check_lot(lot_data: dict) -> tuple[bool, bool]:
+    """
+    Both checks in one pass over the lot's keys:
+    (empty_inn_but_nonempty_orgn, empty_individuals_but_no_inn_orgn).
+    """
+    # Empty list or missing key both count as empty
+    inn_empty = not lot_data.get("debtor_inn")
+    ogrn_empty = not lot_data.get("debtor_ogrn")
+    individuals_empty = lot_data.get("individuals", "") == ""
+    return inn_empty and not ogrn_empty, individuals_empty and inn_empty and ogrn_empty
 
 def main():
     """Main function to analyze INN/OGRN mismatch and individuals classification issues."""
     logger.info(f"Analyzing {INPUT_FILE}")
-    
-    # Load input data
-    data = load_json(INPUT_FILE)
-    if data is None:
+
+    if not os.path.exists(INPUT_FILE):
+        logger.error(f"Input file not found: {INPUT_FILE}")
         return
-    
-    items = data.get("items", [])
-    total_items = len(items)
+
+    # Lots are streamed in and written out one at a time, so peak memory
+    # stays at one lot no matter how big the export is
+    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+    body_path = f"{OUTPUT_FILE}.items.tmp"
+
+    total_items = 0
+    mismatch_count = 0
+    individuals_issue_count = 0
+
+    try:
+        with open(body_path, "wb") as out:
+            for i, lot in enumerate(iter_items(INPUT_FILE), 1):
+                total_items = i
+                # Get the data dict from the lot structure
+                lot_data = lot.setdefault("data", {})
+
+                # Check 1: Empty INN but non-empty OGRN
+                # Check 2: Empty individuals but no INN/OGRN
+                has_inn_orgn_mismatch, has_individuals_issue = check_lot(lot_data)
+                lot_data["empty_inn_but_nonempty_orgn"] = has_inn_orgn_mismatch
+
+                if has_inn_orgn_mismatch:
+                    mismatch_count += 1
+                    logger.info(f"Found INN/OGRN mismatch at lot {i}: {lot['url']}")
+
+                lot_data["empty_individuals_but_no_inn_orgn"] = has_individuals_issue
+
+                if has_individuals_issue:
+                    individuals_issue_count += 1
+                    logger.info(f"Found individuals classification issue at lot {i}: {lot['url']}")
+
+                write_item(out, lot, first=i == 1)
+    except Exception as e:
+        logger.exception(f"Failed to process {INPUT_FILE}: {e}")
+        if os.path.exists(body_path):
+            os.remove(body_path)
+        return
+
     logger.info(f"Loaded {total_items} lots")
-    
     if total_items == 0:
         logger.warning("No items to process")
+        os.remove(body_path)
         return
-    
-    # Process each lot
-    mismatch_count = 0
-    individuals_issue_count = 0
-    
-    for i, lot in enumerate(items, 1):
-        # Get the data dict from the lot structure
-        lot_data = lot.get("data", {})
-        
-        # Check 1: Empty INN but non-empty OGRN
-        has_inn_orgn_mismatch = check_inn_orgn_mismatch(lot_data)
-        lot["data"]["empty_inn_but_nonempty_orgn"] = has_inn_orgn_mismatch
-        
-        if has_inn_orgn_mismatch:
-            mismatch_count += 1
-            logger.info(f"Found INN/OGRN mismatch at lot {i}: {lot['url']}")
-        
-        # Check 2: Empty individuals but no INN/OGRN
-        has_individuals_issue = check_empty_individuals_no_inn_orgn(lot_data)
-        lot["data"]["empty_individuals_but_no_inn_orgn"] = has_individuals_issue
-        
-        if has_individuals_issue:
-            individuals_issue_count += 1
-            logger.info(f"Found individuals classification issue at lot {i}: {lot['url']}")
-    
-    # Update the main data structure
-    data["count"] = total_items
-    data["items"] = items
-    
+
     # Save result
-    save_json(data, OUTPUT_FILE)
-    
+    save_streamed(OUTPUT_FILE, total_items, body_path)
+
     # Summary
     logger.info(f"Analysis complete:")
     logger.info(f"  - Total lots: {total_items}")
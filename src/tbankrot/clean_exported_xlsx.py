@@ -3,10 +3,43 @@ from typing import Union
 
 import pandas as pd
 
+# calamine (Rust) parses xlsx several times faster than openpyxl; xlsxwriter writes
+# faster than openpyxl too. Its constant_memory mode is deliberately not used:
+# pandas emits cells column by column, and constant_memory only keeps the current row.
+XLSX_READ_ENGINE = "calamine"
+XLSX_WRITE_ENGINE = "xlsxwriter"
+
+
+def _read_xlsx(path: Union[str, Path], **kwargs) -> pd.DataFrame:
+    return pd.read_excel(path, engine=XLSX_READ_ENGINE, **kwargs)
+
+
+def _write_xlsx(df: pd.DataFrame, path: Union[str, Path]) -> None:
+    with pd.ExcelWriter(path, engine=XLSX_WRITE_ENGINE) as writer:
+        df.to_excel(writer, index=False)
+
+
+def _to_bool(value) -> bool:
+    """True / 1 / 1.0 / "TRUE" / "true" / "1" -> True, everything else (incl. NaN) -> False."""
+    if isinstance(value, str):
+        return value.upper() in ("TRUE", "1")
+    return value == True  # noqa: E712 - also matches 1 and 1.0
+
+
+def _print_non_empty(df: pd.DataFrame, label: str) -> None:
+    """Diagnostic: how many rows have something in markers/financials."""
+    for col in ("markers", "financials"):
+        if col in df.columns:
+            non_empty = df[col].notna() & df[col].ne("")
+            print(f"{label} {col} non-empty: {non_empty.sum()}/{len(df)}")
+        else:
+            print(f"{col} column not found")
+
 
 def clean_exported_xlsx(
     input_path: Union[str, Path] = "debug/lot_export2.xlsx",
     output_path: Union[str, Path] = None,
+    debug: bool = False,
 ) -> str:
     """
     Clean the exported XLSX file by removing specific rows and columns.
@@ -14,51 +47,34 @@ def clean_exported_xlsx(
     Args:
         input_path: Path to the input XLSX file
         output_path: Path to save the cleaned file. If None, uses input_path with '_cleaned' suffix.
+        debug: Print markers/financials diagnostics (full column scans) along the way.
 
     Returns:
         Path to the cleaned file
     """
     # Read the Excel file
     print(f"Reading file: {input_path}")
-    df = pd.read_excel(input_path)
-    
-    # Diagnostic logging
+    df = _read_xlsx(input_path)
     print(f"Original DataFrame shape: {df.shape}")
-    print(f"Original columns: {list(df.columns)}")
-    
-    # Check for markers and financials columns specifically
-    if 'markers' in df.columns:
-        non_empty_markers = df['markers'].notna() & (df['markers'] != '')
-        print(f"Markers column - non-empty rows: {non_empty_markers.sum()}/{len(df)}")
-    else:
-        print("Markers column not found")
-        
-    if 'financials' in df.columns:
-        non_empty_financials = df['financials'].notna() & (df['financials'] != '')
-        print(f"Financials column - non-empty rows: {non_empty_financials.sum()}/{len(df)}")
-    else:
-        print("Financials column not found")
-    
-    # Log first few rows of problematic columns for inspection
-    problematic_cols = ['markers', 'financials']
-    for col in problematic_cols:
-        if col in df.columns:
-            print(f"\nFirst 3 values in {col} column:")
-            for i, val in enumerate(df[col].head(3)):
-                print(f"  Row {i}: type={type(val)}, value={repr(val)[:100]}...")
+
+    # Diagnostic logging
+    if debug:
+        print(f"Original columns: {list(df.columns)}")
+        _print_non_empty(df, "Original")
+
+        # Log first few rows of problematic columns for inspection
+        for col in ("markers", "financials"):
+            if col in df.columns:
+                print(f"\nFirst 3 values in {col} column:")
+                for i, val in enumerate(df[col].head(3)):
+                    print(f"  Row {i}: type={type(val)}, value={repr(val)[:100]}...")
 
     # Filter out rows where auction_status is "Прием заявок завершен" or "Торги закончились"
     before_filter_rows = len(df)
     df = df[~df["auction_status"].isin(["Прием заявок завершен", "Торги закончились"])]
     print(f"After auction_status filter: {len(df)} rows (removed {before_filter_rows - len(df)} rows)")
-    
-    # Check markers and financials after filtering
-    if 'markers' in df.columns:
-        non_empty_markers_after = df['markers'].notna() & (df['markers'] != '')
-        print(f"Markers after filtering - non-empty: {non_empty_markers_after.sum()}/{len(df)}")
-    if 'financials' in df.columns:
-        non_empty_financials_after = df['financials'].notna() & (df['financials'] != '')
-        print(f"Financials after filtering - non-empty: {non_empty_financials_after.sum()}/{len(df)}")
+    if debug:
+        _print_non_empty(df, "After filtering")
 
     # Drop specified columns if they exist
     columns_to_drop = [
@@ -70,15 +86,9 @@ def clean_exported_xlsx(
     print(f"Dropping columns: {cols_dropped}")
     if cols_dropped:
         df = df.drop(columns=cols_dropped)
-    
+
     # Final check before saving
     print(f"Final DataFrame shape: {df.shape}")
-    if 'markers' in df.columns:
-        final_markers_count = df['markers'].notna() & (df['markers'] != '')
-        print(f"Final markers non-empty: {final_markers_count.sum()}/{len(df)}")
-    if 'financials' in df.columns:
-        final_financials_count = df['financials'].notna() & (df['financials'] != '')
-        print(f"Final financials non-empty: {final_financials_count.sum()}/{len(df)}")
 
     # Determine output path
     if output_path is None:
@@ -88,7 +98,7 @@ def clean_exported_xlsx(
 
     # Save the cleaned DataFrame
     print(f"Saving to: {output_path}")
-    df.to_excel(output_path, index=False)
+    _write_xlsx(df, output_path)
     print("File saved successfully")
 
     return str(output_path)
@@ -110,7 +120,7 @@ def filter_mismatch_rows(
         Path to the filtered file
     """
     # Read the Excel file
-    df = pd.read_excel(input_path)
+    df = _read_xlsx(input_path)
 
     # Define the columns to check
     col1 = "empty_individuals_but_no_inn_orgn"
@@ -122,8 +132,8 @@ def filter_mismatch_rows(
 
     # Create a mask for rows where either column evaluates to True
     # Handle True, TRUE, 1 as truthy values
-    mask1 = df[col1].astype(str).str.upper().isin(["TRUE", "1"]) | (df[col1] == True)
-    mask2 = df[col2].astype(str).str.upper().isin(["TRUE", "1"]) | (df[col2] == True)
+    mask1 = df[col1].map(_to_bool).astype(bool)
+    mask2 = df[col2].map(_to_bool).astype(bool)
 
     # Keep rows where either condition is true
     filter_mask = mask1 | mask2
@@ -136,7 +146,7 @@ def filter_mismatch_rows(
         output_path = Path(output_path)
 
     # Save the filtered DataFrame
-    df_filtered.to_excel(output_path, index=False)
+    _write_xlsx(df_filtered, output_path)
 
     return str(output_path)
 
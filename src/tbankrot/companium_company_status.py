@@ -1,27 +1,82 @@
 # src/companium/companium_company_status.py
 import asyncio
+import re
 from typing import Optional
+from urllib.parse import quote
+
+import httpx
 
 from ..browser import Browser  # your wrapper
-from patchright.async_api import Page  # or "from playwright.async_api import Page" if that’s what Browser uses
+from patchright.async_api import BrowserContext, Page, TimeoutError as PlaywrightTimeoutError  # or "from playwright.async_api import Page" if that’s what Browser uses
 
 
 SEARCH_TIPS_URL = "https://companium.ru/search/tips?query="
 BASE_URL = "https://companium.ru"
+TIPS_TIMEOUT_SECS = 10
+# Fail fast instead of Playwright's 30s default: one hung navigation shouldn't hold a
+# pool page that long; get_statuses retries a timed-out INN once on another page.
+# Set on PagePool pages only: pages passed in by other callers keep their own defaults
+NAV_TIMEOUT_MS = 8000
+ACTION_TIMEOUT_MS = 5000
 
+# Bulk lookups only need the HTML of the company card: lean Chromium flags, a small
+# viewport, and no images/fonts/media on pool pages
+BROWSER_ARGS = [
+    "--disable-gpu",
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--disable-background-networking",
+]
+BROWSER_VIEWPORT = {"width": 800, "height": 600}
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+_HREF_RE = re.compile(r'href="([^"]+)"')
 
-async def get_company_status(page: Page, inn: str) -> Optional[str]:
-    """
-    Navigate via companium search tips for a given INN and extract ONLY the company status.
+# Status block on a company card: green, red, then special-status. Checked in one
+# page.evaluate instead of a locator count()/inner_text() round-trip per selector.
+STATUS_SELECTORS = (
+    "div.text-success.fw-bold",
+    "div.text-danger.fw-bold",
+    "div.fw-bold.special-status",
+)
+_STATUS_JS = """(selectors) => {
+    const loaded = document.readyState !== 'loading';
+    for (const s of selectors) {
+        const el = document.querySelector(s);
+        const txt = el ? el.innerText.trim() : '';
+        if (txt) return { txt, loaded };
+    }
+    return { txt: null, loaded };
+}"""
+# The card is opened with wait_until="commit" and polled: the status is in the initial HTML,
+# so it's usually there well before DOMContentLoaded (which waits for third-party scripts)
+STATUS_POLL_SECS = 0.05
+STATUS_POLL_TRIES = 200  # ~10s cap; polling stops as soon as the DOM is parsed anyway
 
-    Returns:
-        str | None: e.g. "Действующая", "Ликвидирована", or None if not found.
-    """
-    # Home first (helps ensure cookies/UI context). Wait for DOMContentLoaded.
-    await page.goto(BASE_URL, wait_until="domcontentloaded")
+
+async def _tips_href(client: httpx.AsyncClient, inn: str) -> Optional[str]:
+    """First search-tips result for the INN over plain HTTP, no browser involved."""
+    try:
+        resp = await client.get(SEARCH_TIPS_URL + quote(inn))
+        if resp.status_code != 200:
+            return None
+        data = resp.json()
+    except (httpx.HTTPError, ValueError):
+        return None
+    if not isinstance(data, list) or not data or not isinstance(data[0], dict):
+        return None
+    m = _HREF_RE.search(data[0].get("content") or "")
+    return m.group(1) if m else None
+
+
+async def _page_tips_href(page: Page, inn: str) -> Optional[str]:
+    """Search tips via fetch() inside the page (browser cookies); leaves the page on companium."""
+    # Home first (helps ensure cookies/UI context), but only once per page: the tips fetch
+    # just needs to run on the companium origin, and after a lookup the page is still there.
+    if not page.url.startswith(BASE_URL):
+        await page.goto(BASE_URL, wait_until="domcontentloaded")
 
     # Try the same JSON endpoint you used previously to get the first result's link.
-    href = await page.evaluate(
+    return await page.evaluate(
         """async ({ baseUrl, inn }) => {
             try {
                 const resp = await fetch(baseUrl + encodeURIComponent(inn), { credentials: 'include' });
@@ -29,8 +84,11 @@ async def get_company_status(page: Page, inn: str) -> Optional[str]:
                 const data = await resp.json();
                 if (!Array.isArray(data) || data.length === 0) return null;
                 const content = data[0]?.content || '';
-                const m = content.match(/href="([^"]+)"/);
-                return m ? m[1] : null;
+                // Plain indexOf/slice instead of a regex literal re-created per call
+                const i = content.indexOf('href="');
+                if (i < 0) return null;
+                const j = content.indexOf('"', i + 6);
+                return j > i + 6 ? content.slice(i + 6, j) : null;
             } catch (_) {
                 return null;
             }
@@ -38,8 +96,24 @@ async def get_company_status(page: Page, inn: str) -> Optional[str]:
         {"baseUrl": SEARCH_TIPS_URL, "inn": inn},
     )
 
+
+async def get_company_status(
+    page: Page, inn: str, client: Optional[httpx.AsyncClient] = None
+) -> Optional[str]:
+    """
+    Navigate via companium search tips for a given INN and extract ONLY the company status.
+    With `client` (see make_tips_client) the tips are requested over httpx and the browser
+    only opens the company card; without it, or if that request fails, they go through the page.
+
+    Returns:
+        str | None: e.g. "Действующая", "Ликвидирована", or None if not found.
+    """
+    href = await _tips_href(client, inn) if client is not None else None
+    if not href:
+        href = await _page_tips_href(page, inn)
+
     if href:
-        await page.goto(f"{BASE_URL}{href}", wait_until="domcontentloaded")
+        await page.goto(f"{BASE_URL}{href}", wait_until="commit")
     else:
         # Fallback: use the site search UI — fill and press Enter, click the first company link.
         # Use broad, resilient selectors.
@@ -57,28 +131,158 @@ async def get_company_status(page: Page, inn: str) -> Optional[str]:
         await page.wait_for_load_state("domcontentloaded")
 
     # Extract ONLY the status. Try green, red, then special-status.
-    for sel in (
-        "div.text-success.fw-bold",
-        "div.text-danger.fw-bold",
-        "div.fw-bold.special-status",
-    ):
-        loc = page.locator(sel).first
-        if await loc.count() > 0:
-            txt = (await loc.inner_text()).strip()
-            if txt:
-                return txt
+    # Retry while the document is still loading; once it's parsed, a miss is final.
+    for _ in range(STATUS_POLL_TRIES):
+        found = await page.evaluate(_STATUS_JS, list(STATUS_SELECTORS))
+        if found["txt"] or found["loaded"]:
+            return found["txt"]
+        await asyncio.sleep(STATUS_POLL_SECS)
 
     return None
 
 
+async def _block_heavy_resources(route) -> None:
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class PagePool:
+    """
+    Pre-opened pages in one launched browser context, reused across INN lookups.
+
+    Browser wraps a persistent context (launch_persistent_context), so there is a single
+    BrowserContext to draw from; the pool hands out pages in it instead of relaunching
+    Chromium or opening a fresh page per INN. Cookies are shared on purpose — they are
+    what the companium warmup is for.
+    """
+
+    def __init__(self, context: BrowserContext, size: int = 4, block_resources: bool = True):
+        self._context = context
+        self._size = size
+        self._block_resources = block_resources
+        self._pages: list[Page] = []
+        self._queue: asyncio.Queue[Page] = asyncio.Queue()
+
+    async def _new_page(self) -> Page:
+        page = await self._context.new_page()
+        page.set_default_navigation_timeout(NAV_TIMEOUT_MS)
+        page.set_default_timeout(ACTION_TIMEOUT_MS)
+        if self._block_resources:
+            await page.route("**/*", _block_heavy_resources)
+        return page
+
+    async def init(self) -> "PagePool":
+        """
+        Open the pages and warm each up on companium once, in parallel.
+        If opening or warmup fails, the pages opened so far are closed before re-raising.
+        """
+        pages: list[Page] = []
+        try:
+            for _ in range(self._size):
+                pages.append(await self._new_page())
+            await asyncio.gather(*(p.goto(BASE_URL, wait_until="domcontentloaded") for p in pages))
+        except BaseException:
+            for page in pages:
+                if not page.is_closed():
+                    await page.close()
+            raise
+        for page in pages:
+            self._pages.append(page)
+            self._queue.put_nowait(page)
+        return self
+
+    async def acquire(self) -> Page:
+        return await self._queue.get()
+
+    async def release(self, page: Page) -> None:
+        # A page that was closed under us (crash, manual close) is replaced
+        if page.is_closed():
+            self._pages.remove(page)
+            page = await self._new_page()
+            self._pages.append(page)
+        self._queue.put_nowait(page)
+
+    async def close(self) -> None:
+        for page in self._pages:
+            if not page.is_closed():
+                await page.close()
+        self._pages.clear()
+
+
+async def make_tips_client(context: BrowserContext, page: Page) -> httpx.AsyncClient:
+    """
+    httpx client for the search-tips endpoint that looks like the browser to companium:
+    same User-Agent and the context's companium cookies (taken after the warmup).
+    """
+    cookies = httpx.Cookies()
+    for c in await context.cookies(BASE_URL):
+        cookies.set(c["name"], c["value"], domain=c.get("domain", ""), path=c.get("path", "/"))
+    user_agent = await page.evaluate("() => navigator.userAgent")
+    return httpx.AsyncClient(
+        headers={"User-Agent": user_agent, "Referer": f"{BASE_URL}/"},
+        cookies=cookies,
+        timeout=TIPS_TIMEOUT_SECS,
+        follow_redirects=True,
+    )
+
+
+async def get_statuses(
+    context: BrowserContext, inns: list[str], concurrency: int = 8
+) -> dict[str, Optional[str]]:
+    """
+    Look up many INNs at once: up to `concurrency` pages work in parallel, so wall time
+    is ~N/concurrency lookups instead of N. Duplicate INNs are fetched once. Search tips
+    go over one shared httpx client; pages are only used for the company cards.
+
+    Returns:
+        dict INN -> status as from get_company_status; a failed lookup maps to "error: ..."
+        (same convention as filter_oksana.enrich_with_status).
+    """
+    unique = list(dict.fromkeys(inns))
+    if not unique:
+        return {}
+    # The pool size is the concurrency limit: a lookup waits in acquire() for a free page
+    pool = await PagePool(context, size=min(concurrency, len(unique))).init()
+    client: Optional[httpx.AsyncClient] = None
+
+    async def one(inn: str) -> tuple[str, Optional[str]]:
+        for attempt in range(2):
+            page = await pool.acquire()
+            try:
+                return inn, await get_company_status(page, inn, client)
+            except PlaywrightTimeoutError as e:
+                # Retire the stuck page (release() swaps in a fresh one) and retry once
+                await page.close()
+                if attempt:
+                    return inn, f"error: {e}"
+            except Exception as e:
+                return inn, f"error: {e}"
+            finally:
+                await pool.release(page)
+
+    try:
+        page = await pool.acquire()
+        try:
+            client = await make_tips_client(context, page)
+        finally:
+            await pool.release(page)
+        return dict(await asyncio.gather(*(one(inn) for inn in unique)))
+    finally:
+        if client is not None:
+            await client.aclose()
+        await pool.close()
+
+
 # --- tiny demo runner (optional) ---
 async def _demo():
-    browser = Browser(headless=False, datadir="datadir")
+    browser = Browser(headless=True, datadir="datadir", args=BROWSER_ARGS, viewport=BROWSER_VIEWPORT)
     await browser.launch()
-    page = await browser.context.new_page()
     try:
-        status = await get_company_status(page, "7728168971")  # sample INN
-        print("STATUS:", status)
+        statuses = await get_statuses(browser.context, ["7728168971", "7707083893"])  # sample INNs
+        for inn, status in statuses.items():
+            print("STATUS:", inn, status)
     finally:
         await browser.close()
 
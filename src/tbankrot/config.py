@@ -1,10 +1,14 @@
 import os
+from functools import cached_property
 from typing import Any, Dict
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Значения из окружения и заголовки собираются один раз на экземпляр (cached_property):
+# .env читается при импорте, а словари не пересобираются на каждый запрос.
+# Полученные словари общие — не изменяйте их, копируйте ({**config.headers, ...}).
 class Config:
     # Конфигурация API
     API_URL = 'https://api.tbankrot.ru'
@@ -21,11 +25,11 @@ class Config:
     DEFAULT_OUTPUT_FILE = 'parsed_output.json'
     DEFAULT_CHECKPOINT_FILE = 'parsing_checkpoint.json'
 
-    @property
+    @cached_property
     def auth_token(self) -> str:
         return os.getenv("TBANKROT_AUTH_TOKEN")
 
-    @property
+    @cached_property
     def api_config(self) -> Dict[str, str]:
         return {
             "uid": os.getenv("TBANKROT_UID"),
@@ -33,11 +37,11 @@ class Config:
             "device_id": os.getenv("TBANKROT_DEVICE_ID"),
         }
 
-    @property
+    @cached_property
     def cookies(self) -> Dict[str, str]:
         return {"s360hash": os.getenv("TBANKROT_S360HASH")}
 
-    @property
+    @cached_property
     def headers(self) -> Dict[str, str]:
         return {
             'auth-token': self.auth_token,
@@ -47,62 +51,66 @@ class Config:
             'User-Agent': 'okhttp/3.12.12',
         }
     # поменять запрос для второй части задачи
-    @property
-    def default_search_params(self) -> Dict[str, Any]:
-        return {
-            'text': None,
-            'stop': None,
-            'swp': None,
-            'sort': None,
-            'show_period': None,
-            'num': None,
-            'start_p1': None,
-            'start_p2': None,
-            'min_p1': None,
-            'min_p2': None,
-            'pp_1': None,
-            'pp_2': None,
-            'p1': None,
-            'p2': None,
-            'st_1': '17-09-24',
-            'st_2': None,
-            'et_1': None,
-            'et_2': '17-09-25',
-            'sz_1': None,
-            'sz_2': None,
-            'ez_1': None,
-            'ez_2': None,
-            'debtor': None,
-            'au': None,
-            'org': None,
-            'keywords': None,
-            'stopwords': None,
-            'type_1': 'on',
-            'type_2': None,
-            'type_3': None,
-            'type_4': None,
-            'type_5': None,
-            'region': None,
-            'place': None,
-            'sub_cat': [33],
-            'show_checked': None,
-            'photo': None,
-            'show_closed': '1',
-            'show_paused': None,
-            'sort_order': 'asc',
-            'mark': None,
-        }
+    _SEARCH_PARAMS_TEMPLATE: Dict[str, Any] = {
+        'text': None,
+        'stop': None,
+        'swp': None,
+        'sort': None,
+        'show_period': None,
+        'num': None,
+        'start_p1': None,
+        'start_p2': None,
+        'min_p1': None,
+        'min_p2': None,
+        'pp_1': None,
+        'pp_2': None,
+        'p1': None,
+        'p2': None,
+        'st_1': '17-09-24',
+        'st_2': None,
+        'et_1': None,
+        'et_2': '17-09-25',
+        'sz_1': None,
+        'sz_2': None,
+        'ez_1': None,
+        'ez_2': None,
+        'debtor': None,
+        'au': None,
+        'org': None,
+        'keywords': None,
+        'stopwords': None,
+        'type_1': 'on',
+        'type_2': None,
+        'type_3': None,
+        'type_4': None,
+        'type_5': None,
+        'region': None,
+        'place': None,
+        'sub_cat': [33],
+        'show_checked': None,
+        'photo': None,
+        'show_closed': '1',
+        'show_paused': None,
+        'sort_order': 'asc',
+        'mark': None,
+    }
+
+    def get_default_search_params(self) -> Dict[str, Any]:
+        """Копия параметров поиска по умолчанию — её можно менять."""
+        params = self._SEARCH_PARAMS_TEMPLATE.copy()
+        params['sub_cat'] = list(params['sub_cat'])
+        return params
 
     # Конфигурация OpenRouter AI
     OPENROUTER_API_URL = 'https://openrouter.ai/api/v1/chat/completions'
     OPENROUTER_MODEL = 'google/gemini-2.5-flash-lite'
     
-    @property
+    @cached_property
     def openrouter_token(self) -> str:
         """Токен для OpenRouter API."""
         return os.getenv("OPENROUTER_APIKEY")
 
-    @property 
+    @cached_property
     def openrouter_headers(self) -> Dict[str, str]:
         """Заголовки для запросов к OpenRouter API."""
         return {
@@ -113,7 +121,7 @@ class Config:
     # Конфигурация Федресурс
     FEDRESURS_TIMEOUT = 30
 
-    @property
+    @cached_property
     def fedresurs_headers(self) -> Dict[str, str]:
         """Заголовки для запросов к Федресурс."""
         return {
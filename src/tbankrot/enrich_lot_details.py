@@ -1,13 +1,22 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import json
+import asyncio
+import mmap
 import os
-from typing import Any, Dict
+from typing import Any, Dict, Iterator, List
 
+import httpx
+import ijson
+import orjson
 from loguru import logger
 
-from .ai_request import update_debtor_data, update_debtor_flags
+from .ai_request import (
+    REQUEST_TIMEOUT_SECS,
+    update_debtor_all_async,
+    update_debtor_data_async,
+    update_debtor_flags_async,
+)
 
 INPUT_FILE = "debug/lot_details_enriched.json"
 OUTPUT_FILE = "debug/lot_details_full_ai.json"
@@ -15,6 +24,10 @@ OUTPUT_FILE = "debug/lot_details_full_ai.json"
 # Configuration - set to True/False to enable/disable each step
 RUN_STEP_1 = False  # update_debtor_data (debtor_name, inn, ogrn, etc.)
 RUN_STEP_2 = True  # update_debtor_flags (foreign_debtor_flag, individuals)
+# Both enabled: one combined request per lot (update_debtor_all) instead of two
+
+# Lots enriched in parallel; each one is checkpointed as soon as it is done
+CONCURRENCY = 8
 
 
 def load_json(path: str) -> Dict[str, Any]:
@@ -24,23 +37,109 @@ def load_json(path: str) -> Dict[str, Any]:
         return {"count": 0, "items": []}
     
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        # orjson parses straight from the mapped file: no extra file-sized bytes copy from read()
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as mv:
+                return orjson.loads(mv)
     except Exception as e:
         logger.exception(f"Failed to load {path}: {e}")
         return {"count": 0, "items": []}
 
-def save_json(data: Dict[str, Any], path: str):
-    """Save JSON atomically to avoid corruption."""
+def save_json(data: Dict[str, Any], path: str, pretty: bool = False, fsync: bool = False):
+    """
+    Save JSON atomically to avoid corruption.
+    Compact by default: this is an intermediate for the next stage, and indenting
+    roughly doubles both the size and the dump time. pretty=True for files meant for eyes.
+    os.replace alone keeps checkpoints whole; fsync=True (a full disk barrier) only for final saves.
+    """
     os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+    try:
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(data, option=option))
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+        logger.info(f"Saved {len(data.get('items', []))} items to {path}")
+    except Exception as e:
+        logger.exception(f"Failed to save {path}: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def iter_items(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream lots from items[*] one by one instead of loading the whole file."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        # use_float: nominal_debt etc. as float, not Decimal (orjson can't dump Decimal)
+        yield from ijson.items(f, "items.item", use_float=True)
+
+def iter_checkpoint(path: str) -> Iterator[Dict[str, Any]]:
+    """Lots appended to the NDJSON checkpoint; a line cut off by a crash is skipped."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                yield orjson.loads(line)
+            except orjson.JSONDecodeError:
+                logger.warning(f"Skipping truncated line in {path}")
+
+def trim_checkpoint(path: str):
+    """Cut a partial last line (crash mid-write) so new lots aren't appended onto it."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+def append_checkpoint(lots: List[Dict[str, Any]], path: str):
+    """Append processed lots to the NDJSON checkpoint: O(batch) per save, not O(all items)."""
+    with open(path, "ab") as f:
+        for lot in lots:
+            f.write(orjson.dumps(lot, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE))
+
+def coalesce_output(path: str, checkpoint: str, last_index: Dict[str, int]):
+    """
+    Stream existing output items + checkpoint lots into the final {"count", "items"} file,
+    one lot per URL, then drop the checkpoint.
+
+    last_index maps each URL in the existing output to its last position there: earlier
+    copies (appended by older re-runs) are dropped. A lot re-processed in this run replaces
+    its old entry in place; lots new to the output go at the end.
+    """
+    updated: Dict[str, Dict[str, Any]] = {}
+    for lot in iter_checkpoint(checkpoint):
+        updated[lot["url"]] = lot
+    count = len(last_index.keys() | updated.keys())
+
+    def merged() -> Iterator[Dict[str, Any]]:
+        for i, lot in enumerate(iter_items(path)):
+            url = lot["url"]
+            if last_index.get(url) == i:
+                yield updated.pop(url, lot)
+        yield from updated.values()
+
     tmp = f"{path}.tmp"
     try:
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with open(tmp, "wb") as f:
+            f.write(b'{"count":%d,"items":[' % count)
+            first = True
+            for lot in merged():
+                if not first:
+                    f.write(b",")
+                f.write(orjson.dumps(lot, option=orjson.OPT_NON_STR_KEYS))
+                first = False
+            f.write(b"]}")
             f.flush()
             os.fsync(f.fileno())
         os.replace(tmp, path)
-        logger.info(f"Saved {len(data.get('items', []))} items to {path}")
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        logger.info(f"Saved {count} items to {path}")
     except Exception as e:
         logger.exception(f"Failed to save {path}: {e}")
         if os.path.exists(tmp):
@@ -59,7 +158,7 @@ def has_step2_data(lot: Dict[str, Any]) -> bool:
     return "foreign_debtor_flag" in data and "individuals" in data
 
 
-def process_step1(lot: Dict[str, Any]) -> Dict[str, Any]:
+async def process_step1(lot: Dict[str, Any], client: httpx.AsyncClient) -> Dict[str, Any]:
     """Step 1: Process debtor data extraction if announcement_text is non-empty."""
     data = lot.get("data", {})
     announcement_text = data.get("announcement_text", "").strip()
@@ -73,7 +172,7 @@ def process_step1(lot: Dict[str, Any]) -> Dict[str, Any]:
     
     # Call AI to enrich data
     try:
-        enriched_data = update_debtor_data(data)
+        enriched_data = await update_debtor_data_async(data, client)
         lot["data"] = enriched_data
         debtor_count = len(enriched_data.get("debtor_name", []))
         logger.info(
@@ -88,7 +187,7 @@ def process_step1(lot: Dict[str, Any]) -> Dict[str, Any]:
     
     return lot
 
-def process_step2(lot: Dict[str, Any]) -> Dict[str, Any]:
+async def process_step2(lot: Dict[str, Any], client: httpx.AsyncClient) -> Dict[str, Any]:
     """Step 2: Process debtor flags classification."""
     data = lot.get("data", {})
 
@@ -105,7 +204,7 @@ def process_step2(lot: Dict[str, Any]) -> Dict[str, Any]:
 
     # Call AI to classify flags
     try:
-        enriched_data = update_debtor_flags(data)
+        enriched_data = await update_debtor_flags_async(data, client)
         lot["data"] = enriched_data
         foreign_flag = enriched_data.get("foreign_debtor_flag", 0)
         individuals = enriched_data.get("individuals", "")
@@ -119,16 +218,50 @@ def process_step2(lot: Dict[str, Any]) -> Dict[str, Any]:
     return lot
 
 
-def process_lot(lot: Dict[str, Any]) -> Dict[str, Any]:
+async def process_both_steps(lot: Dict[str, Any], client: httpx.AsyncClient) -> Dict[str, Any]:
+    """Steps 1 and 2 together: one AI request per lot (update_debtor_all) instead of two."""
+    data = lot.get("data", {})
+    announcement_text = data.get("announcement_text", "").strip()
+
+    if not announcement_text:
+        # Same empty defaults as steps 1 and 2 leave for an empty announcement
+        for key in ["debtor_name", "debtor_inn", "debtor_ogrn", "case_number", "nominal_debt"]:
+            if key not in data:
+                data[key] = []
+        if "foreign_debtor_flag" not in data:
+            data["foreign_debtor_flag"] = 0
+        if "individuals" not in data:
+            data["individuals"] = ""
+        return lot
+
+    try:
+        enriched_data = await update_debtor_all_async(data, client)
+        lot["data"] = enriched_data
+        debtor_count = len(enriched_data.get("debtor_name", []))
+        logger.info(
+            f"Steps 1+2 - Processed lot {lot['url']}: extracted {debtor_count} debtor names, "
+            f"foreign_flag={enriched_data.get('foreign_debtor_flag', 0)}, "
+            f"individuals={enriched_data.get('individuals', '')}"
+        )
+    except Exception as e:
+        logger.exception(f"Steps 1+2 - Failed to process lot {lot['url']}: {e}")
+
+    return lot
+
+
+async def process_lot(lot: Dict[str, Any], client: httpx.AsyncClient) -> Dict[str, Any]:
     """Process single lot based on enabled steps."""
     processed = False
 
-    if RUN_STEP_1:
-        lot = process_step1(lot)
+    if RUN_STEP_1 and RUN_STEP_2:
+        # One combined prompt: the announcement is sent (and paid for) once
+        lot = await process_both_steps(lot, client)
         processed = True
-
-    if RUN_STEP_2:
-        lot = process_step2(lot)
+    elif RUN_STEP_1:
+        lot = await process_step1(lot, client)
+        processed = True
+    elif RUN_STEP_2:
+        lot = await process_step2(lot, client)
         processed = True
 
     if not processed:
@@ -137,6 +270,24 @@ def process_lot(lot: Dict[str, Any]) -> Dict[str, Any]:
     return lot
 
 
+async def run_all(lots: List[Dict[str, Any]], on_lot) -> None:
+    """
+    Enrich lots over one shared HTTP client with CONCURRENCY workers pulling from a
+    shared iterator: a worker takes the next lot as soon as its previous one is done,
+    so one slow lot doesn't hold up the rest. on_lot(enriched_lot) is called for each
+    finished lot (for incremental saves).
+    """
+    pending = iter(lots)
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT_SECS, limits=limits) as client:
+        async def worker() -> None:
+            for lot in pending:
+                on_lot(await process_lot(lot, client))
+
+        await asyncio.gather(*(worker() for _ in range(min(CONCURRENCY, len(lots)))))
+
+
 def main():
     """Main processing function with incremental updates."""
     # Validate configuration
@@ -154,49 +305,52 @@ def main():
         f"Starting enrichment: steps={steps_enabled}, input={INPUT_FILE}, output={OUTPUT_FILE}"
     )
     
-    # Load input data
-    input_data = load_json(INPUT_FILE)
-    items = input_data.get("items", [])
-    total_items = len(items)
-    logger.info(f"Loaded {total_items} lots from input")
-    
-    if total_items == 0:
-        logger.warning("No items to process")
-        return
-
-    # Initialize variables
-    existing_items = []
+    checkpoint = f"{OUTPUT_FILE}.ndjson"
     processed_urls_step1 = set()
     processed_urls_step2 = set()
 
-    # Load existing output if it exists
-    if os.path.exists(OUTPUT_FILE):
-        output_data = load_json(OUTPUT_FILE)
-        existing_items = output_data.get("items", [])
-
-        # Track which URLs already have data for each step
-        for item in existing_items:
-            if RUN_STEP_1 and has_step1_data(item):
-                processed_urls_step1.add(item["url"])
-            if RUN_STEP_2 and has_step2_data(item):
-                processed_urls_step2.add(item["url"])
+    def track(item: Dict[str, Any]):
+        if RUN_STEP_1 and has_step1_data(item):
+            processed_urls_step1.add(item["url"])
+        if RUN_STEP_2 and has_step2_data(item):
+            processed_urls_step2.add(item["url"])
 
-        logger.info(f"Found existing output with {len(existing_items)} items")
+    # Track which URLs already have data for each step: existing output + checkpoint
+    # left by an interrupted run, both streamed so no lot list is held in memory.
+    # last_index: URL -> its last position in the output, to drop duplicates on the final save
+    last_index: Dict[str, int] = {}
+    if os.path.exists(OUTPUT_FILE):
+        for i, item in enumerate(iter_items(OUTPUT_FILE)):
+            track(item)
+            last_index[item["url"]] = i
+        logger.info(f"Found existing output with {len(last_index)} lots")
     else:
         logger.info("No existing output file found - starting fresh")
 
+    trim_checkpoint(checkpoint)
+    checkpoint_count = 0
+    for item in iter_checkpoint(checkpoint):
+        track(item)
+        checkpoint_count += 1
+    if checkpoint_count:
+        logger.info(f"Found checkpoint with {checkpoint_count} items from an interrupted run")
+
     if RUN_STEP_1:
         logger.info(f"  - Step 1: {len(processed_urls_step1)} lots already processed")
     if RUN_STEP_2:
         logger.info(f"  - Step 2: {len(processed_urls_step2)} lots already processed")
-    
-    # Process new items incrementally
-    new_items = []
+
+    if not os.path.exists(INPUT_FILE):
+        logger.error(f"Input file not found: {INPUT_FILE}")
+        return
+
+    # Stream input, keeping only lots that still need processing
+    pending = []
+    total_items = 0
     skipped_count = 0
-    processed_count = 0
-    save_interval = 10  # Save every 10 items
 
-    for i, lot in enumerate(items, 1):
+    for lot in iter_items(INPUT_FILE):
+        total_items += 1
         url = lot["url"]
 
         # Skip if both steps are already done for this lot
@@ -208,54 +362,31 @@ def main():
         if RUN_STEP_1 and RUN_STEP_2 and skip_this_lot:
             skipped_count += 1
             continue
-        
-        logger.info(f"Processing {i}/{total_items}: {url}")
-        enriched_lot = process_lot(lot)
-        new_items.append(enriched_lot)
+        pending.append(lot)
+
+    logger.info(f"Loaded {total_items} lots from input")
+    if total_items == 0:
+        logger.warning("No items to process")
+        return
+
+    logger.info(f"Processing {len(pending)} lots, {CONCURRENCY} at a time")
+
+    # Process new items incrementally
+    processed_count = 0
+
+    def on_lot(enriched_lot: Dict[str, Any]):
+        """Append a finished lot to the checkpoint so progress survives a crash."""
+        nonlocal processed_count
         processed_count += 1
-        
-        # Save progress every N items to avoid losing work
-        if processed_count % save_interval == 0:
-            # Merge new items with existing items
-            all_items = existing_items + new_items
-            save_data = {
-                "count": len(all_items),
-                "items": all_items
-            }
-            save_json(save_data, OUTPUT_FILE)
-            logger.info(f"Incremental save: {processed_count} new items processed, total {len(all_items)} items")
-            
-            # Update existing_items to include the new ones for next merge
-            # Also update processed_urls sets
-            for item in new_items:
-                item_url = item["url"]
-                if RUN_STEP_1 and has_step1_data(item):
-                    processed_urls_step1.add(item_url)
-                if RUN_STEP_2 and has_step2_data(item):
-                    processed_urls_step2.add(item_url)
-
-            existing_items = all_items
-            new_items = []  # Clear to avoid duplicates
-    
-    # Final merge and save
-    if new_items:
-        all_items = existing_items + new_items
-        # Update processed_urls for final batch
-        for item in new_items:
-            item_url = item["url"]
-            if RUN_STEP_1 and has_step1_data(item):
-                processed_urls_step1.add(item_url)
-            if RUN_STEP_2 and has_step2_data(item):
-                processed_urls_step2.add(item_url)
-    else:
-        all_items = existing_items
-    
-    final_data = {
-        "count": len(all_items),
-        "items": all_items
-    }
-    
-    save_json(final_data, OUTPUT_FILE)
+        append_checkpoint([enriched_lot], checkpoint)
+        if processed_count % CONCURRENCY == 0 or processed_count == len(pending):
+            logger.info(f"Incremental save: {processed_count}/{len(pending)} new items processed")
+        track(enriched_lot)
+
+    asyncio.run(run_all(pending, on_lot))
+
+    # Final save: existing output + checkpoint -> one JSON file
+    coalesce_output(OUTPUT_FILE, checkpoint, last_index)
     
     logger.info(f"Completed enrichment:")
     logger.info(f"  - Steps enabled: {steps_enabled}")
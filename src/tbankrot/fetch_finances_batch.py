@@ -1,14 +1,23 @@
+from __future__ import annotations
+
 import asyncio
-import json
 import logging
 import os
 import re
+import signal
 import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+import ijson
+import orjson
+
+if TYPE_CHECKING:
+    # Imported where used: the progress/WAL helpers must load without Playwright
+    from src.browser import Browser
 
-from src.browser import Browser
-from src.listorg.main import run
+
+_VALID_INN_RE = re.compile(r"\d{9,10}")
 
 
 def _is_valid_inn(inn_string: str) -> bool:
@@ -19,22 +28,30 @@ def _is_valid_inn(inn_string: str) -> bool:
     inn_string = inn_string.strip()
 
     # Check if the string contains ONLY 9 or 10 digits, nothing else.
-    return bool(re.fullmatch(r"^\d{9,10}$", inn_string))
+    return _VALID_INN_RE.fullmatch(inn_string) is not None
 
 
-def _atomic_write_json(data: dict, path: Path | str):
-    """Custom atomic write that handles Path objects and dict data."""
+def _atomic_write_json(data: dict, path: Path | str, do_fsync: bool = False, pretty: bool = False):
+    """
+    Custom atomic write that handles Path objects and dict data.
+    Compact unless pretty=True: indenting roughly doubles the bytes of every snapshot.
+    os.replace keeps the file whole even on a kill; do_fsync=True additionally flushes it
+    to disk (a full barrier) — only worth it for the final save.
+    """
     if isinstance(path, Path):
         path_str = str(path)
     else:
         path_str = path
 
-    os.makedirs(os.path.dirname(path_str), exist_ok=True)
+    # The directory is created once by main(), not on every snapshot
     tmp = f"{path_str}.tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
+    # Serialize once in memory; a payload bigger than the file buffer goes out in one write()
+    payload = orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    with open(tmp, "wb") as f:
+        f.write(payload)
+        if do_fsync:
+            f.flush()
+            os.fsync(f.fileno())
 
     max_retries = 3
     retry_delay = 2  # seconds
@@ -57,8 +74,8 @@ def _atomic_write_json(data: dict, path: Path | str):
                 )
                 # Fallback: direct write (less atomic but should work)
                 try:
-                    with open(path_str, "w", encoding="utf-8") as f:
-                        json.dump(data, f, ensure_ascii=False, indent=2)
+                    with open(path_str, "wb") as f:
+                        f.write(payload)
                     logging.info(f"Fallback direct write successful for {path_str}")
                     # Clean up tmp
                     os.remove(tmp)
@@ -76,33 +93,40 @@ def _atomic_write_json(data: dict, path: Path | str):
         os.remove(tmp)
 
 
-def _load_json_safely(path: Path | str) -> dict:
-    """Safely load JSON file, return empty dict if not exists or invalid."""
+def _load_progress(path: Path | str) -> tuple[dict, dict]:
+    """
+    Stream items[*] of an existing output file into _normalize_progress, so the
+    file is never held as raw data and normalized copy at once.
+    Empty progress if the file does not exist or is invalid.
+    """
     path_str = str(path)
     if not os.path.exists(path_str):
-        return {}
+        return _normalize_progress([])
     try:
-        with open(path_str, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(path_str, "rb") as f:
+            # use_float: numbers as float, not Decimal (orjson can't dump Decimal)
+            return _normalize_progress(ijson.items(f, "items.item", use_float=True))
     except Exception as e:
         logging.error(f"Failed to load existing JSON '{path_str}': {e}")
-        return {}
+        return _normalize_progress([])
 
 
-def _normalize_progress(existing_data: dict) -> tuple[dict, dict]:
+def _normalize_progress(items: Iterable[Any]) -> tuple[dict, dict]:
     """
-    Normalize existing data to standard schema:
+    Normalize existing items to standard schema:
     {"count": int, "items": [{"url": str, "status": str, "error": str, "data": dict}]}
     Returns normalized payload and URL-to-index map.
     """
-    items = existing_data.get("items", [])
     norm_items = []
+    index = {}
     for item in items:
         if isinstance(item, dict) and "url" in item:
             # Ensure data has finances_data if success
             data = item.get("data", {})
             if item.get("status") == "success" and "finances_data" not in data:
                 data["finances_data"] = {"error": "missing data"}
+            if item.get("url"):
+                index[item["url"]] = len(norm_items)
             norm_items.append(
                 {
                     "url": item.get("url", ""),
@@ -118,7 +142,6 @@ def _normalize_progress(existing_data: dict) -> tuple[dict, dict]:
         "count": len(norm_items),
         "items": norm_items
     }
-    index = {it["url"]: i for i, it in enumerate(norm_items) if it.get("url")}
     return payload, index
 
 
@@ -127,24 +150,134 @@ def _upsert_item(progress: dict, index: dict, record: dict):
     url = record.get("url", "")
     if not url:
         return
-    if url in index:
-        # Find the actual index in current items list
-        current_items = progress["items"]
-        current_index = None
-        for j, it in enumerate(current_items):
-            if it.get("url") == url:
-                current_index = j
-                break
-        if current_index is not None:
-            current_items[current_index] = record
+    current_items = progress["items"]
+    current_index = index.get(url)
+    if current_index is not None and 0 <= current_index < len(current_items):
+        # index is kept in sync with progress["items"], no need to scan for the position
+        current_items[current_index] = record
     else:
+        if current_index is not None:
+            logging.warning(f"Stale index {current_index} for {url}, appending the record instead")
         progress["items"].append(record)
         index[url] = len(progress["items"]) - 1
         progress["count"] = len(progress["items"])
 
 
+def _merge_record(input_item: dict, existing: Optional[dict]) -> dict:
+    """Standard record for an input lot; status, error and data from a previous run win."""
+    data = input_item.get("data", {})
+    if existing is None:
+        return {"url": input_item["url"], "status": "error", "error": "", "data": data}
+    data.update(existing.get("data", {}))
+    return {
+        "url": input_item["url"],
+        "status": existing.get("status", "error"),
+        "error": existing.get("error", ""),
+        "data": data,
+    }
+
+
+def _append_wal(wal, record: dict):
+    """Append one processed record to the JSONL write-ahead log (flushed, not fsynced)."""
+    wal.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+    wal.flush()
+
+
+def _replay_wal(progress: dict, index: dict, path: Path | str) -> int:
+    """
+    Apply records from a WAL left by an interrupted run on top of the loaded snapshot.
+    A line cut off mid-write is skipped. Returns the number of records applied.
+    """
+    path_str = str(path)
+    if not os.path.exists(path_str):
+        return 0
+    replayed = 0
+    with open(path_str, "rb") as f:
+        for line in f:
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                logging.warning(f"Skipping truncated WAL line in {path_str}")
+                continue
+            _upsert_item(progress, index, record)
+            replayed += 1
+    return replayed
+
+
+class Admission:
+    """
+    Concurrency limit that, unlike asyncio.Semaphore, can be resized while tasks wait on it.
+    Lowering the limit lets running lots finish; new ones start once active < limit.
+    The limit is kept within [1, max_limit].
+    """
+
+    def __init__(self, limit: int, max_limit: int):
+        self.active = 0
+        self.max_limit = max(1, max_limit)
+        self.limit = min(max(1, limit), self.max_limit)
+        self.cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def release(self):
+        async with self.cond:
+            self.active -= 1
+            self.cond.notify(1)
+
+    async def resize(self, limit: int):
+        if limit > self.max_limit:
+            logging.warning(f"Finance concurrency {limit} requested, capped at {self.max_limit}")
+        async with self.cond:
+            self.limit = min(max(1, limit), self.max_limit)
+            logging.info(f"Finance concurrency set to {self.limit} ({self.active} active)")
+            self.cond.notify_all()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.release()
+
+
+def _install_resize_signals(admission: Admission):
+    """kill -USR1 halves the concurrency limit, kill -USR2 doubles it up to admission.max_limit (POSIX only)."""
+    if not hasattr(signal, "SIGUSR1"):
+        return
+
+    # The current limit is read when the coroutine runs, so repeated signals compound
+    async def halve():
+        await admission.resize(admission.limit // 2)
+
+    async def double():
+        await admission.resize(admission.limit * 2)
+
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGUSR1, lambda: asyncio.ensure_future(halve()))
+    loop.add_signal_handler(signal.SIGUSR2, lambda: asyncio.ensure_future(double()))
+
+
 INPUT_FILE = Path("debug/lot_details_with_inn_ogrn_check.json")
 OUTPUT_FILE = Path("debug/lot_details_with_finances2.json")
+OUTPUT_DIR = OUTPUT_FILE.parent
+# Every processed lot is appended here right away; the full OUTPUT_FILE snapshot is only
+# rewritten every SNAPSHOT_EVERY_ITEMS lots / SNAPSHOT_EVERY_SECS seconds and at the end
+WAL_FILE = OUTPUT_FILE.with_suffix(".jsonl")
+SNAPSHOT_EVERY_ITEMS = 50
+SNAPSHOT_EVERY_SECS = 30
+# Lots fetched from list-org at the same time (each run() opens its own page);
+# adjustable while running via SIGUSR1 / SIGUSR2, see _install_resize_signals.
+# A proxy switch relaunches the one shared context and kills the pages other lookups
+# still have open on the old one; those lookups are retried, see fetch_finances_for_inn
+FINANCE_CONCURRENCY = 4
+# Ceiling for SIGUSR2: list-org starts answering with captchas and rate limits past it,
+# and every extra lookup is another page to kill and retry on a proxy relaunch
+FINANCE_MAX_CONCURRENCY = 8
+# Times an INN is retried after the browser context was relaunched under it
+CONTEXT_RELAUNCH_RETRIES = 2
 
 FINANCE_PARAMS = {
     "method": "finances",
@@ -156,14 +289,22 @@ INN_REGEX = re.compile(r'ИНН (\d{10})')
 
 async def fetch_finances_for_inn(inn: str, browser: Browser) -> Dict[str, Any]:
     """Fetch financial data for a given INN using listorg run function."""
+    from src.listorg.main import run  # local import: pulls in Playwright
+
     logging.info(f"Fetching finances for INN: {inn}")
-    try:
-        # The `run` function now expects the custom Browser object
-        result = await run(browser, inn, **FINANCE_PARAMS)
-        return result
-    except Exception as e:
-        logging.error(f"Error fetching finances for INN {inn}: {e}")
-        return {"error": str(e)}
+    for attempt in range(CONTEXT_RELAUNCH_RETRIES + 1):
+        context = browser.context
+        try:
+            # The `run` function now expects the custom Browser object
+            result = await run(browser, inn, **FINANCE_PARAMS)
+        except Exception as e:
+            logging.error(f"Error fetching finances for INN {inn}: {e}")
+            result = {"error": str(e)}
+        # A concurrent lookup switched proxies mid-run: the failure is the closed page, not the INN
+        if "error" not in result or browser.context is context or attempt == CONTEXT_RELAUNCH_RETRIES:
+            return result
+        logging.warning(f"Browser context was relaunched while fetching INN {inn}, retrying")
+    return result
 
 
 async def process_lot(
@@ -184,24 +325,7 @@ async def process_lot(
         data["finances_data"] = {}
         return True, "", False  # No browser used
 
-    # Change from bankrupt_inn to debtor_inn array
-    debtor_inn = data.get("debtor_inn", [])
-
-    valid_inns: list[str] = []
-
-    # Process all INNs in debtor_inn array
-    if debtor_inn and isinstance(debtor_inn, list) and len(debtor_inn) > 0:
-        for potential_inn in debtor_inn:
-            if _is_valid_inn(potential_inn):
-                valid_inns.append(potential_inn.strip())
-
-
-    # If no valid INNs found, set empty finances_data and return success
-    if not valid_inns:
-        data["finances_data"] = {}
-        return True, "", False  # No browser used
-
-    # Updated skip_if_exists check for dict format
+    # Updated skip_if_exists check for dict format; before INN validation, which it makes moot
     if (
         skip_if_exists
         and "finances_data" in data
@@ -222,6 +346,23 @@ async def process_lot(
         if has_success:
             return True, "", False  # Already has data, no browser used
 
+    # Change from bankrupt_inn to debtor_inn array
+    debtor_inn = data.get("debtor_inn", [])
+
+    valid_inns: list[str] = []
+
+    # Process all INNs in debtor_inn array
+    if debtor_inn and isinstance(debtor_inn, list) and len(debtor_inn) > 0:
+        for potential_inn in debtor_inn:
+            if _is_valid_inn(potential_inn):
+                valid_inns.append(potential_inn.strip())
+
+
+    # If no valid INNs found, set empty finances_data and return success
+    if not valid_inns:
+        data["finances_data"] = {}
+        return True, "", False  # No browser used
+
     # Fetch finances for ALL valid INNs
     finances_results = {}
     overall_success = False
@@ -274,53 +415,45 @@ async def main() -> None:
         return
 
     # Load input
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        input_data: Dict[str, Any] = json.load(f)
+    with open(INPUT_FILE, "rb") as f:
+        input_data: Dict[str, Any] = orjson.loads(f.read())
 
     input_items: List[Dict[str, Any]] = input_data.get("items", [])
     if not input_items:
         print("No items found in JSON.")
         return
 
-    # Load and normalize existing output if exists
-    existing_raw = _load_json_safely(OUTPUT_FILE)
-    progress, url_index = _normalize_progress(existing_raw)
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    # Load and normalize existing output if exists, then replay the WAL of an interrupted run
+    progress, url_index = _load_progress(OUTPUT_FILE)
+    replayed = _replay_wal(progress, url_index, WAL_FILE)
+    if replayed:
+        logging.info(f"Replayed {replayed} record(s) from {WAL_FILE}")
+        # Fold them into the snapshot so the WAL can start empty
+        await asyncio.to_thread(_atomic_write_json, progress, OUTPUT_FILE)
+        os.remove(WAL_FILE)
+
+    # Merge input lots with what previous runs stored for the same URL
+    existing_by_url = {it["url"]: it for it in progress["items"] if it.get("url")}
+    records = {
+        inp["url"]: _merge_record(inp, existing_by_url.get(inp["url"]))
+        for inp in input_items
+        if inp.get("url")
+    }
 
-    # Start with ALL existing items to preserve progress
-    all_items = progress["items"].copy()
+    # Start with ALL existing items to preserve progress, merged ones in place, new ones at the end
+    all_items = [records.get(it["url"], it) for it in progress["items"]]
+    all_items.extend(r for url, r in records.items() if url not in existing_by_url)
+    url_index = {it["url"]: i for i, it in enumerate(all_items) if it.get("url")}
+    # One payload for the whole run: _upsert_item and the snapshots share it
+    progress = {"count": len(all_items), "items": all_items}
 
     # Track items that need processing
     items_to_process = []
     skipped_count = 0
 
-    for input_item in input_items:
-        url = input_item.get("url", "")
-        if not url:
-            continue
-
-        # Ensure standard structure
-        record = {
-            "url": url,
-            "status": "error",
-            "error": "",
-            "data": input_item.get("data", {}),
-        }
-
-        if url in url_index:
-            # Merge with existing data
-            existing_record = progress["items"][url_index[url]]
-            record["status"] = existing_record.get("status", "error")
-            record["error"] = existing_record.get("error", "")
-            record["data"].update(existing_record.get("data", {}))
-
-            # Update the record in all_items
-            if url_index[url] < len(all_items):
-                all_items[url_index[url]] = record
-        else:
-            # New item - add to all_items
-            all_items.append(record)
-            url_index[url] = len(all_items) - 1
-
+    for record in records.values():
         # Check if this item needs processing
         # Skip only if status is "success" AND finances_data contains valid financial data
         if record["status"] == "success":
@@ -351,13 +484,11 @@ async def main() -> None:
         else:
             items_to_process.append(record)
 
-    # Separate items to process: errors first, then new
-    error_items = [item for item in items_to_process if item["status"] == "error"]
-    new_items = [item for item in items_to_process if item["status"] != "error"]
-    items_to_process = error_items + new_items
+    # Errors first, then new; the sort is stable and in place, so no extra lists
+    items_to_process.sort(key=lambda item: item["status"] != "error")
 
-    error_count = len(error_items)
-    new_count = len(new_items)
+    new_count = sum(item["status"] != "error" for item in items_to_process)
+    error_count = len(items_to_process) - new_count
     logging.info(
         f"Loaded {len(all_items)} total items: {skipped_count} skipped (success), {error_count} errors to retry, {new_count} new"
     )
@@ -366,26 +497,70 @@ async def main() -> None:
         print("No items to process.")
         return
 
+    from src.browser import Browser  # local import: pulls in Playwright
+
     # Launch browser
     browser = Browser(headless=False, datadir="datadir")
     await browser.launch()
+    wal = open(WAL_FILE, "wb", buffering=1 << 16)
+
+    since_snapshot = 0
+    last_snapshot = time.monotonic()
+    wal_records = 0
+    # Snapshot requests (WAL records covered, final); bounded, so a slow disk holds back
+    # the result loop instead of piling up requests
+    save_q: asyncio.Queue = asyncio.Queue(maxsize=2)
+
+    async def saver():
+        """Background writer: the result loop only enqueues, writes run here one at a time."""
+        while True:
+            upto, final = await save_q.get()
+            try:
+                # Off the event loop: the write (and its PermissionError retry sleeps) must not
+                # stall the list-org pages still in flight. orjson holds the GIL for the whole
+                # dump, so the thread sees a consistent progress even while lots complete.
+                await asyncio.to_thread(_atomic_write_json, progress, OUTPUT_FILE, final)
+                # Everything in the WAL is in the snapshot now, unless lots were added
+                # meanwhile; then keep it, replaying records twice is harmless
+                if wal_records == upto:
+                    wal.seek(0)
+                    wal.truncate()
+            except Exception as e:
+                logging.error(f"Snapshot of {OUTPUT_FILE} failed, progress kept in {WAL_FILE}: {e}")
+            finally:
+                save_q.task_done()
+
+    async def snapshot(final: bool = False):
+        nonlocal since_snapshot, last_snapshot
+        logging.info(f"Snapshot - saving {len(all_items)} lot(s), {since_snapshot} new since last")
+        await save_q.put((wal_records, final))
+        since_snapshot = 0
+        last_snapshot = time.monotonic()
+
+    admission = Admission(FINANCE_CONCURRENCY, FINANCE_MAX_CONCURRENCY)
+    _install_resize_signals(admission)
+
+    async def bounded(i: int, item: Dict[str, Any]):
+        async with admission:
+            is_error_retry = i < error_count
+            print(
+                f"Processing {'error retry' if is_error_retry else 'new'} lot {i + 1}/{len(items_to_process)}: {item['url']}"
+            )
+            return item, await process_lot(item, browser)
 
+    saver_task = asyncio.create_task(saver())
+    tasks: List[asyncio.Task] = []
     try:
-        # Track accumulated lots for batched saving
-        accumulated_lots: List[str] = []
         browser_used_count: int = 0
         no_browser_count: int = 0
-        
-        # Process items that need work (errors first, then new)
-        for i, item in enumerate(items_to_process):
+
+        # Process items that need work (errors first, then new), up to admission.limit
+        # at a time; each lot is recorded as soon as it finishes, not in input order
+        tasks = [asyncio.create_task(bounded(i, item)) for i, item in enumerate(items_to_process)]
+        for fut in asyncio.as_completed(tasks):
+            item, (success, error_msg, used_browser) = await fut
             url = item["url"]
-            is_error_retry = i < error_count
-            print(
-                f"Processing {'error retry' if is_error_retry else 'new'} lot {i + 1}/{len(items_to_process)}: {url}"
-            )
 
-            success, error_msg, used_browser = await process_lot(item, browser)
-            
             if success:
                 item["status"] = "success"
                 item["error"] = ""
@@ -398,34 +573,42 @@ async def main() -> None:
                 logging.error(f"Error processing {url}: {error_msg}")
 
             # Update the item in all_items
-            _upsert_item({"count": len(all_items), "items": all_items}, url_index, item)
-            
-            # Accumulate this lot
-            accumulated_lots.append(url)
-            
+            _upsert_item(progress, url_index, item)
+
+            # Persist this lot right away, the full snapshot only now and then
+            _append_wal(wal, item)
+            wal_records += 1
+            since_snapshot += 1
+
             if used_browser:
                 browser_used_count += 1
-                # Save all accumulated lots when browser was used
-                logging.info(f"Browser used - saving {len(accumulated_lots)} accumulated lot(s)")
-                _atomic_write_json(
-                    {"count": len(all_items), "items": all_items}, OUTPUT_FILE
-                )
-                accumulated_lots = []  # Reset accumulator
             else:
                 no_browser_count += 1
-                logging.info(f"No browser used - accumulated {len(accumulated_lots)} lot(s) for next save")
-        
-        # Save any remaining accumulated lots at the end
-        if accumulated_lots:
-            logging.info(f"Final save - saving {len(accumulated_lots)} remaining accumulated lot(s)")
-            _atomic_write_json(
-                {"count": len(all_items), "items": all_items}, OUTPUT_FILE
-            )
-        
+
+            if (
+                since_snapshot >= SNAPSHOT_EVERY_ITEMS
+                or time.monotonic() - last_snapshot >= SNAPSHOT_EVERY_SECS
+            ):
+                await snapshot()
+
         print(f"Batch processing complete. Browser used: {browser_used_count}, No browser: {no_browser_count}")
         print(f"Output saved to {OUTPUT_FILE}")
 
     finally:
+        for task in tasks:
+            task.cancel()
+        if hasattr(signal, "SIGUSR1"):
+            loop = asyncio.get_running_loop()
+            loop.remove_signal_handler(signal.SIGUSR1)
+            loop.remove_signal_handler(signal.SIGUSR2)
+        # Final snapshot on any exit; the WAL is only needed if it fails
+        if since_snapshot:
+            await snapshot(final=True)
+        await save_q.join()
+        saver_task.cancel()
+        wal.close()
+        if os.path.exists(WAL_FILE) and os.path.getsize(WAL_FILE) == 0:
+            os.remove(WAL_FILE)
         await browser.close()
 
 
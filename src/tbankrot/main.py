@@ -19,7 +19,7 @@ from urllib.parse import urlparse, parse_qs
 
 from loguru import logger
 
-from .ai_request import update_debtor_data, update_debtor_flags
+from .ai_request import update_debtor_all
 
 from .parse_lots_links import main as parse_lots_links
 from .parse_lot_data import parse_lot
@@ -181,8 +181,7 @@ async def run():
                 if not data.get("debtor_inn"):
                     try:
                         logger.info(f"[{idx}/{total}] Running AI enrichment for lot {lot_id}")
-                        enriched = update_debtor_data(data)
-                        enriched = update_debtor_flags(enriched)
+                        enriched = update_debtor_all(data)
 
                         # 2a) Add counts
                         debtors_count = max(
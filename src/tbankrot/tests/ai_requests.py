@@ -4,7 +4,7 @@
 import json
 import os
 
-from ..ai_request import update_debtor_data, update_debtor_flags
+from ..ai_request import update_debtor_all
 
 def main(n: int = 3):
     cache_path = os.path.join("cache", "lots_cache.json")
@@ -20,8 +20,7 @@ def main(n: int = 3):
             print("No announcement_text found, skipping")
             continue
 
-        enriched = update_debtor_data({"announcement_text": announcement_text})
-        enriched = update_debtor_flags(enriched)
+        enriched = update_debtor_all({"announcement_text": announcement_text})
         # Save enriched data back into the lot’s "data" section
         lots_cache[lot_id]["data"].update(enriched)
 
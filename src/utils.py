@@ -1,4 +1,8 @@
 from loguru import logger
+
+# Deletes ASCII digits; anything left over means the INN has a non-digit
+_DIGIT_DELETE = str.maketrans("", "", "0123456789")
+
 def process_inn(inn: str) -> str:
     # if inn is None then throw ValueError,
     # if not a string then convert to string
@@ -7,13 +11,12 @@ def process_inn(inn: str) -> str:
         raise ValueError("INN cannot be None")
     if not isinstance(inn, str):
         inn = str(inn)
-    if not inn.isdigit():
+    # Empty counts as non-digit too (as with isdigit), not as a length error
+    if not inn or inn.translate(_DIGIT_DELETE):
         raise ValueError("INN must contain only digits")
-    if len(inn) == 9:
-        inn = '0' + inn
     if len(inn) < 9 or len(inn) > 10:
         raise ValueError("INN must be 9 or 10 digits long")
-    return inn
+    return inn.zfill(10)
 
 def calculate_financial_coefficients(financial_data: dict) -> dict:
     """
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("patchright")
+
+from src.tbankrot.companium_company_status import PagePool
+
+
+class FakePage:
+    def __init__(self, fail_goto: bool = False):
+        self.fail_goto = fail_goto
+        self.closed = False
+
+    def set_default_navigation_timeout(self, timeout):
+        pass
+
+    def set_default_timeout(self, timeout):
+        pass
+
+    async def route(self, pattern, handler):
+        pass
+
+    async def goto(self, url, **kwargs):
+        await asyncio.sleep(0)
+        if self.fail_goto:
+            raise RuntimeError("warmup failed")
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self, fail_on: int = -1):
+        self.fail_on = fail_on
+        self.pages: list[FakePage] = []
+
+    async def new_page(self) -> FakePage:
+        page = FakePage(fail_goto=len(self.pages) == self.fail_on)
+        self.pages.append(page)
+        return page
+
+
+def test_init_closes_pages_when_warmup_fails():
+    context = FakeContext(fail_on=2)
+    pool = PagePool(context, size=4)
+
+    with pytest.raises(RuntimeError, match="warmup failed"):
+        asyncio.run(pool.init())
+
+    assert len(context.pages) == 4
+    assert all(page.closed for page in context.pages)
+
+
+def test_init_keeps_pages_open_on_success():
+    context = FakeContext()
+
+    async def run():
+        pool = await PagePool(context, size=2).init()
+        page = await pool.acquire()
+        assert not page.closed
+        await pool.release(page)
+        await pool.close()
+
+    asyncio.run(run())
+    assert len(context.pages) == 2
+    assert all(page.closed for page in context.pages)
@@ -0,0 +1,50 @@
+import orjson
+import pytest
+
+pytest.importorskip("ijson")
+
+from src.tbankrot.fetch_finances_batch import _append_wal, _normalize_progress, _replay_wal
+
+
+def _record(url: str, status: str, **data) -> dict:
+    return {"url": url, "status": status, "error": "", "data": data}
+
+
+def test_replay_wal_applies_records_on_top_of_snapshot(tmp_path):
+    progress, index = _normalize_progress([
+        _record("u1", "error"),
+        _record("u2", "success", finances_data={"revenue": 1}),
+    ])
+    wal_path = tmp_path / "out.json.wal"
+    with open(wal_path, "wb") as wal:
+        _append_wal(wal, _record("u1", "success", finances_data={"revenue": 2}))
+        _append_wal(wal, _record("u3", "success", finances_data={"revenue": 3}))
+    with open(wal_path, "ab") as wal:
+        wal.write(b'{"url": "u4", "sta')  # torn by a crash mid-write
+
+    assert _replay_wal(progress, index, wal_path) == 2
+
+    assert progress["count"] == 3
+    assert [item["url"] for item in progress["items"]] == ["u1", "u2", "u3"]
+    assert progress["items"][0]["data"] == {"finances_data": {"revenue": 2}}
+    assert index == {"u1": 0, "u2": 1, "u3": 2}
+    # Snapshot stays serializable after replay
+    assert orjson.loads(orjson.dumps(progress)) == progress
+
+
+def test_replay_wal_later_record_wins(tmp_path):
+    progress, index = _normalize_progress([])
+    wal_path = tmp_path / "out.json.wal"
+    with open(wal_path, "wb") as wal:
+        _append_wal(wal, _record("u1", "error"))
+        _append_wal(wal, _record("u1", "success", finances_data={}))
+
+    assert _replay_wal(progress, index, wal_path) == 2
+    assert progress["count"] == 1
+    assert progress["items"][0]["status"] == "success"
+
+
+def test_replay_wal_without_wal(tmp_path):
+    progress, index = _normalize_progress([_record("u1", "error")])
+    assert _replay_wal(progress, index, tmp_path / "missing.wal") == 0
+    assert progress["count"] == 1
@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+import httpx
+
+from src import rdl_batch
+from src.rdl_batch import Checkpointer, RdlBatcher, replay_journal
+
+
+def test_replay_journal_skips_truncated_last_line(tmp_path):
+    auctions = [{"lot_link": "a"}, {"lot_link": "b"}]
+    journal = tmp_path / "out.json.jsonl"
+    journal.write_text(
+        json.dumps({"i": 0, "lot_link": "a", "auction": {"lot_link": "a", "final_RDL": "нет"}})
+        + "\n"
+        + '{"i": 1, "lot_link": "b", "auct',  # torn by a crash mid-write
+        encoding="utf-8",
+    )
+
+    assert replay_journal(auctions, str(journal)) == 1
+    assert auctions == [{"lot_link": "a", "final_RDL": "нет"}, {"lot_link": "b"}]
+
+
+def test_replay_journal_ignores_records_that_dont_line_up(tmp_path):
+    auctions = [{"lot_link": "a"}]
+    journal = tmp_path / "out.json.jsonl"
+    journal.write_text(
+        json.dumps({"i": 0, "lot_link": "other", "auction": {"lot_link": "other"}}) + "\n"
+        + json.dumps({"i": 5, "lot_link": "a", "auction": {"lot_link": "a"}}) + "\n",
+        encoding="utf-8",
+    )
+
+    assert replay_journal(auctions, str(journal)) == 0
+    assert auctions == [{"lot_link": "a"}]
+
+
+def test_replay_journal_without_journal(tmp_path):
+    assert replay_journal([{"lot_link": "a"}], str(tmp_path / "missing.jsonl")) == 0
+
+
+def test_checkpointer_writes_only_every_n_changes(tmp_path):
+    target = tmp_path / "out.json"
+    obj = {"auctions": []}
+
+    async def run():
+        cp = Checkpointer(str(target), every=3, interval=3600)
+        for i in range(2):
+            obj["auctions"].append(i)
+            await cp.maybe_flush(obj)
+        assert not target.exists()
+
+        obj["auctions"].append(2)
+        await cp.maybe_flush(obj)
+        assert json.loads(target.read_text(encoding="utf-8")) == {"auctions": [0, 1, 2]}
+
+        # Nothing pending: flush() leaves the file alone
+        obj["auctions"].append(3)
+        await cp.flush(obj)
+        assert json.loads(target.read_text(encoding="utf-8")) == {"auctions": [0, 1, 2]}
+
+    asyncio.run(run())
+
+
+def _ok_payload(inn: str) -> dict:
+    return {"success": True, "data": {"debtor_inn": inn, "final_RDL": "нет"}}
+
+
+def test_batcher_falls_back_to_per_inn_requests(monkeypatch):
+    monkeypatch.setattr(rdl_batch, "API_RETRIES", 0)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append((request.method, request.url.path))
+        if request.method == "POST":
+            return httpx.Response(404)
+        inn = request.url.path.rsplit("/", 1)[-1]
+        return httpx.Response(200, json=_ok_payload(inn))
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            batcher = RdlBatcher(client, max_wait=0.01)
+            try:
+                first = await asyncio.gather(batcher.call("1", "01.01.2024"), batcher.call("2", "01.01.2024"))
+                assert not batcher.enabled
+                later = await batcher.call("3", "01.01.2024")
+            finally:
+                await batcher.aclose()
+        return first, later
+
+    first, later = asyncio.run(run())
+
+    assert [r[1]["debtor_inn"] for r in first] == ["1", "2"]
+    assert later == (True, {"debtor_inn": "3", "final_RDL": "нет"}, None)
+    # One batch attempt, then per-INN GETs only
+    assert [m for m, _ in requests].count("POST") == 1
+    assert sorted(p for m, p in requests if m == "GET") == [
+        "/company_rdl/1", "/company_rdl/2", "/company_rdl/3",
+    ]
+
+
+def test_batcher_405_also_disables_batching():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            return httpx.Response(405)
+        return httpx.Response(200, json=_ok_payload("1"))
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            batcher = RdlBatcher(client, max_wait=0.01)
+            try:
+                return await batcher.call("1", "01.01.2024"), batcher.enabled
+            finally:
+                await batcher.aclose()
+
+    result, enabled = asyncio.run(run())
+    assert result[0] is True
+    assert enabled is False
+
+
+def test_batcher_uses_batch_endpoint_when_available():
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.method == "POST"
+        body = json.loads(request.content)
+        return httpx.Response(200, json={
+            "success": True,
+            "data": [dict(_ok_payload(item["inn"]), status_code=200) for item in body],
+        })
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            batcher = RdlBatcher(client, max_wait=0.01)
+            try:
+                return await asyncio.gather(*(batcher.call(str(i), "01.01.2024") for i in range(3))), batcher.enabled
+            finally:
+                await batcher.aclose()
+
+    results, enabled = asyncio.run(run())
+    assert [r[1]["debtor_inn"] for r in results] == ["0", "1", "2"]
+    assert enabled is True